@@ -4,39 +4,46 @@
 """
 
 import csv
+import gzip
 import io
+import os
+import tempfile
+import zipfile
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from database import Database
+from typing import Any, List, Dict, Optional, Iterable, Sequence, Tuple, BinaryIO
+from database import Database, Participant
 
 db = Database()
 
+# Сжатие файла экспорта: '' (обычный CSV), 'gzip' или 'zip'
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "")
+# До этого размера файл экспорта держится в памяти, дальше — на диске
+EXPORT_SPOOL_SIZE = 1024 * 1024
+
 
 def get_statistics() -> Dict:
     """Получить общую статистику"""
-    participants = db.get_all_participants()
+    groups = db.get_participant_counts()
     
-    total = len(participants)
-    activated = sum(1 for p in participants if p.get('is_activated'))
+    total = sum(g['total'] for g in groups)
+    activated = sum(g['activated'] for g in groups)
     not_activated = total - activated
     
-    # По языкам
     by_language = {}
-    for p in participants:
-        lang = p.get('language', 'ru')
-        by_language[lang] = by_language.get(lang, 0) + 1
-    
-    # По датам
     by_date = {}
-    for p in participants:
-        date = p.get('zoom_date', 'не указана')
-        by_date[date] = by_date.get(date, 0) + 1
-    
-    # По типам участников
     by_type = {}
-    for p in participants:
-        ptype = p.get('participant_type', 'participant')
-        by_type[ptype] = by_type.get(ptype, 0) + 1
+    for g in groups:
+        # По языкам
+        lang = g['language'] or 'ru'
+        by_language[lang] = by_language.get(lang, 0) + g['total']
+        
+        # По датам
+        date = str(g['zoom_date']) if g['zoom_date'] else 'не указана'
+        by_date[date] = by_date.get(date, 0) + g['total']
+        
+        # По типам участников
+        ptype = g['participant_type'] or 'participant'
+        by_type[ptype] = by_type.get(ptype, 0) + g['total']
     
     return {
         'total': total,
@@ -48,26 +55,63 @@ def get_statistics() -> Dict:
     }
 
 
-def get_participants_by_date(zoom_date: str) -> List[Dict]:
-    """Получить участников по дате"""
-    return db.get_participants_by_date(zoom_date)
+def get_participants_by_date(zoom_date: str, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+    """Получить участников по дате (columns — только нужные колонки)"""
+    return db.get_participants_by_date(zoom_date, columns)
 
 
-def get_recent_participants(limit: int = 20) -> List[Dict]:
+def get_recent_participants(limit: int = 20) -> List[Participant]:
     """Получить последних зарегистрированных участников"""
-    participants = db.get_all_participants()
-    return participants[:limit]
+    return db.get_recent_participants(limit)
 
 
-def export_participants_to_csv() -> io.StringIO:
-    """Экспорт всех участников в CSV"""
-    participants = db.get_all_participants()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
+def write_csv_export(
+    header: List[str],
+    rows: Iterable[List],
+    filename: str,
+    compression: Optional[str] = None
+) -> Tuple[BinaryIO, str]:
+    """
+    Записать CSV построчно во временный файл (при необходимости сжатый).
+    Память не зависит от количества строк: больше EXPORT_SPOOL_SIZE файл лежит на диске
+    (отправлять через bot_admin_handlers.export_document, чтобы не читать его целиком).
+    Возвращает (файл, имя файла).
+    """
+    compression = EXPORT_COMPRESSION if compression is None else compression
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE, mode='w+b')
+    
+    archive = None
+    if compression == 'gzip':
+        archive = gzip.GzipFile(filename=filename, fileobj=output, mode='wb')
+        stream = archive
+        filename += '.gz'
+    elif compression == 'zip':
+        archive = zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED)
+        stream = archive.open(filename, 'w')
+        filename = filename[:-len('.csv')] + '.zip'
+    else:
+        stream = output
+    
+    # utf-8-sig: Excel правильно открывает кириллицу и иврит
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    
+    if compression == 'zip':
+        stream.close()
+    if archive is not None:
+        archive.close()
     
-    # Заголовки
-    writer.writerow([
+    output.seek(0)
+    return output, filename
+
+
+def export_participants_to_csv(compression: Optional[str] = None) -> Tuple[BinaryIO, str]:
+    """Экспорт всех участников в CSV (потоково). Возвращает (файл, имя файла)"""
+    header = [
         'ID участника',
         'Telegram ID',
         'Username',
@@ -79,37 +123,37 @@ def export_participants_to_csv() -> io.StringIO:
         'Язык',
         'Активирован',
         'Дата активации'
-    ])
+    ]
     
-    # Данные
-    for p in participants:
-        writer.writerow([
-            p.get('participant_id', ''),
-            p.get('telegram_id', ''),
-            p.get('username', ''),
-            p.get('first_name', ''),
-            p.get('participant_type', ''),
-            p.get('activation_code', ''),
-            p.get('registration_date', ''),
-            p.get('zoom_date', ''),
-            p.get('language', ''),
-            'Да' if p.get('is_activated') else 'Нет',
-            p.get('activation_date', '')
-        ])
+    columns = (
+        'participant_id', 'telegram_id', 'username', 'first_name', 'participant_type',
+        'activation_code', 'registration_date', 'zoom_date', 'language', 'is_activated',
+        'activation_date'
+    )
+    rows = (
+        [
+            p.participant_id,
+            p.telegram_id,
+            p.username,
+            p.first_name,
+            p.participant_type,
+            p.activation_code,
+            p.registration_date,
+            p.zoom_date,
+            p.language,
+            'Да' if p.is_activated else 'Нет',
+            p.activation_date
+        ]
+        for p in db.iter_all_participants(columns)
+    )
     
-    output.seek(0)
-    return output
+    filename = f"participants_all_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return write_csv_export(header, rows, filename, compression)
 
 
-def export_participants_by_date_to_csv(zoom_date: str) -> io.StringIO:
-    """Экспорт участников конкретной даты в CSV"""
-    participants = db.get_participants_by_date(zoom_date)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Заголовки
-    writer.writerow([
+def export_participants_by_date_to_csv(zoom_date: str, compression: Optional[str] = None) -> Tuple[BinaryIO, str]:
+    """Экспорт участников конкретной даты в CSV. Возвращает (файл, имя файла)"""
+    header = [
         'ID участника',
         'Telegram ID',
         'Username',
@@ -117,22 +161,26 @@ def export_participants_by_date_to_csv(zoom_date: str) -> io.StringIO:
         'Код активации',
         'Язык',
         'Активирован'
-    ])
+    ]
     
-    # Данные
-    for p in participants:
-        writer.writerow([
-            p.get('participant_id', ''),
-            p.get('telegram_id', ''),
-            p.get('username', ''),
-            p.get('first_name', ''),
-            p.get('activation_code', ''),
-            p.get('language', ''),
-            'Да' if p.get('is_activated') else 'Нет'
-        ])
+    columns = (
+        'participant_id', 'telegram_id', 'username', 'first_name', 'activation_code',
+        'language', 'is_activated'
+    )
+    rows = (
+        [
+            p.participant_id,
+            p.telegram_id,
+            p.username,
+            p.first_name,
+            p.activation_code,
+            p.language,
+            'Да' if p.is_activated else 'Нет'
+        ]
+        for p in db.iter_participants({'zoom_date': zoom_date}, columns)
+    )
     
-    output.seek(0)
-    return output
+    return write_csv_export(header, rows, f"participants_{zoom_date}.csv", compression)
 
 
 def get_participant_details(telegram_id: int) -> Optional[Dict]:
@@ -140,37 +188,37 @@ def get_participant_details(telegram_id: int) -> Optional[Dict]:
     return db.get_user(telegram_id)
 
 
-def activate_participants_bulk(codes: List[str]) -> Tuple[int, int]:
+def activate_participants_bulk(codes: List[str]) -> Dict[str, List[str]]:
     """
     Массовая активация по кодам
-    Возвращает (успешно, ошибок)
+    Возвращает {'activated': [...], 'already_active': [...], 'unknown': [...]}
     """
     return db.activate_users_bulk(codes)
 
 
 def get_dates_with_counts() -> List[Dict]:
     """Получить все даты с количеством участников"""
-    participants = db.get_all_participants()
+    groups = db.get_participant_counts()
     
     dates_dict = {}
-    for p in participants:
-        date = p.get('zoom_date')
-        if date and date != 'не указана':
-            if date not in dates_dict:
-                dates_dict[date] = {
-                    'date': date,
-                    'total': 0,
-                    'activated': 0,
-                    'by_language': {}
-                }
-            
-            dates_dict[date]['total'] += 1
-            
-            if p.get('is_activated'):
-                dates_dict[date]['activated'] += 1
-            
-            lang = p.get('language', 'ru')
-            dates_dict[date]['by_language'][lang] = dates_dict[date]['by_language'].get(lang, 0) + 1
+    for g in groups:
+        if not g['zoom_date']:
+            continue
+        
+        date = str(g['zoom_date'])
+        if date not in dates_dict:
+            dates_dict[date] = {
+                'date': date,
+                'total': 0,
+                'activated': 0,
+                'by_language': {}
+            }
+        
+        dates_dict[date]['total'] += g['total']
+        dates_dict[date]['activated'] += g['activated']
+        
+        lang = g['language'] or 'ru'
+        dates_dict[date]['by_language'][lang] = dates_dict[date]['by_language'].get(lang, 0) + g['total']
     
     # Сортируем по дате
     dates_list = sorted(dates_dict.values(), key=lambda x: x['date'])
@@ -185,15 +233,23 @@ def get_telegram_ids_by_category(
 ) -> List[int]:
     """
     Получить список Telegram ID по категориям для рассылки
+    (для больших рассылок — get_telegram_ids_page)
     """
-    participants = db.get_participants_by_category(
-        language=language,
-        participant_type=participant_type,
-        zoom_date=zoom_date
-    )
-    
-    if only_activated:
-        participants = [p for p in participants if p.get('is_activated')]
-    
-    return [p['telegram_id'] for p in participants]
+    filters = {
+        'language': language,
+        'participant_type': participant_type,
+        'zoom_date': zoom_date,
+        'is_activated': True if only_activated else None
+    }
+    return [p.telegram_id for p in db.iter_participants(filters, ('telegram_id',))]
+
+
+def count_participants(filters: Optional[Dict[str, Any]] = None) -> int:
+    """Количество получателей рассылки по фильтрам"""
+    return db.count_participants(filters)
+
+
+def get_telegram_ids_page(filters: Optional[Dict[str, Any]], after_telegram_id: Optional[int] = None) -> List[int]:
+    """Следующая страница Telegram ID получателей рассылки"""
+    return db.get_telegram_ids_page(filters, after_telegram_id)
 
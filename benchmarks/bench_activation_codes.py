@@ -0,0 +1,85 @@
+"""
+Стоимость выдачи кода активации из пула при 10k / 100k / 500k участников
+
+    python benchmarks/bench_activation_codes.py [--sizes 10000,100000,500000] [--samples 2000]
+
+Участники добавляются массовым импортом (коды берутся из того же пула, голова
+очереди activation_code_pool — удалённые строки). На каждом размере замеряются
+generate_activation_code и полная регистрация без даты: сразу после импорта
+и (PostgreSQL) после VACUUM таблицы пула.
+"""
+
+import argparse
+import time
+
+from harness import BACKEND, bench_database, percentile, report
+
+
+def import_participants(db, start: int, count: int):
+    db.bulk_import_participants(
+        {'telegram_id': telegram_id, 'first_name': 'bench'}
+        for telegram_id in range(start, start + count)
+    )
+
+
+def measure(func, samples: int) -> list:
+    """Задержки func() в миллисекундах"""
+    latencies = []
+    for i in range(samples):
+        started = time.perf_counter()
+        func(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def vacuum_pool(db):
+    with db.connection() as conn:
+        conn.autocommit = True
+        conn.execute("VACUUM activation_code_pool")
+        conn.autocommit = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,500000')
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    rows = []
+    with bench_database() as db:
+        participants = 0
+        next_id = 1
+        for size in sizes:
+            import_participants(db, next_id, size - participants)
+            next_id += size - participants
+            participants = size
+
+            phases = [('после импорта', None)]
+            if BACKEND == 'postgres':
+                phases.append(('после VACUUM', vacuum_pool))
+            for phase, prepare in phases:
+                if prepare:
+                    prepare(db)
+                codes = measure(lambda i: db.generate_activation_code(), args.samples)
+                registrations = measure(
+                    lambda i: db.register_participant(10 ** 9 + next_id + i, None, 'bench', 'participant'),
+                    args.samples
+                )
+                next_id += args.samples
+                participants += args.samples
+                rows.append([
+                    f"{size:,}", phase,
+                    f"{sum(codes) / len(codes):.3f}", f"{percentile(codes, 0.95):.3f}", f"{max(codes):.2f}",
+                    f"{sum(registrations) / len(registrations):.3f}", f"{percentile(registrations, 0.95):.3f}",
+                ])
+
+    report(
+        "Выдача кода активации, мс",
+        ["участников", "пул", "код avg", "код p95", "код max", "регистрация avg", "регистрация p95"],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
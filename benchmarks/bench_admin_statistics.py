@@ -0,0 +1,146 @@
+"""
+Статистика админки (📊): прежний путь против агрегатов в БД на 100k участников
+
+    python benchmarks/bench_admin_statistics.py [--participants 100000] [--repeat 5]
+
+Сравниваются три способа получить данные для get_statistics и get_dates_with_counts:
+    все строки   — SELECT * всей таблицы в список dict и подсчёт в Python (как было)
+    GROUP BY     — COUNT(*) и COUNT(*) FILTER (WHERE is_activated) по группам в БД
+    сводная      — готовые счётчики registration_stats (get_participant_counts)
+Для каждого — медиана времени из --repeat прогонов и пик памяти Python (tracemalloc).
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from harness import bench_database, report
+
+LANGUAGES = ['ru', 'en', 'he']
+TYPES = ['participant', 'speaker', 'volunteer']
+DATES = [f'2030-02-{day:02d}' for day in range(1, 15)]
+
+GROUP_BY_QUERY = """
+    SELECT zoom_date, language, participant_type,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE is_activated) AS activated
+    FROM participants
+    GROUP BY zoom_date, language, participant_type
+"""
+
+
+def populate(db, count: int):
+    rng = random.Random(9)
+    db.bulk_import_participants(
+        {
+            'telegram_id': telegram_id,
+            'first_name': f'user {telegram_id}',
+            'email': f'user{telegram_id}@example.com',
+            'language': rng.choice(LANGUAGES),
+            'participant_type': rng.choice(TYPES),
+            'zoom_date': rng.choice(DATES + [None]),
+        }
+        for telegram_id in range(1, count + 1)
+    )
+    with db.connection() as conn:
+        codes = [row['activation_code'] for row in conn.execute(
+            "SELECT activation_code FROM participants WHERE telegram_id % 5 < 2"
+        ).fetchall()]
+    db.activate_users_bulk(codes)
+
+
+def all_rows_path(db):
+    """Как было: все участники в память, подсчёт в Python"""
+    with db.connection() as conn:
+        participants = [dict(row) for row in conn.execute(
+            "SELECT * FROM participants ORDER BY registration_date DESC"
+        ).fetchall()]
+
+    by_language, by_date, by_type, dates = {}, {}, {}, {}
+    activated = sum(1 for p in participants if p.get('is_activated'))
+    for p in participants:
+        lang = p.get('language', 'ru')
+        by_language[lang] = by_language.get(lang, 0) + 1
+        date = p.get('zoom_date', 'не указана')
+        by_date[date] = by_date.get(date, 0) + 1
+        ptype = p.get('participant_type', 'participant')
+        by_type[ptype] = by_type.get(ptype, 0) + 1
+        if p.get('zoom_date'):
+            entry = dates.setdefault(p['zoom_date'], {'total': 0, 'activated': 0, 'by_language': {}})
+            entry['total'] += 1
+            entry['activated'] += 1 if p.get('is_activated') else 0
+            entry['by_language'][lang] = entry['by_language'].get(lang, 0) + 1
+    return len(participants), activated
+
+
+def fold(groups):
+    """Свёртка строк-групп, как в admin.get_statistics / get_dates_with_counts"""
+    by_language, by_date, by_type, dates = {}, {}, {}, {}
+    for g in groups:
+        lang = g['language'] or 'ru'
+        by_language[lang] = by_language.get(lang, 0) + g['total']
+        date = str(g['zoom_date']) if g['zoom_date'] else 'не указана'
+        by_date[date] = by_date.get(date, 0) + g['total']
+        ptype = g['participant_type'] or 'participant'
+        by_type[ptype] = by_type.get(ptype, 0) + g['total']
+        if g['zoom_date']:
+            entry = dates.setdefault(date, {'total': 0, 'activated': 0, 'by_language': {}})
+            entry['total'] += g['total']
+            entry['activated'] += g['activated']
+            entry['by_language'][lang] = entry['by_language'].get(lang, 0) + g['total']
+    return sum(g['total'] for g in groups), sum(g['activated'] for g in groups)
+
+
+def group_by_path(db):
+    with db.connection() as conn:
+        groups = [dict(row) for row in conn.execute(GROUP_BY_QUERY).fetchall()]
+    return fold(groups)
+
+
+def summary_table_path(db):
+    return fold(db.get_participant_counts())
+
+
+def measure(path, db, repeat: int):
+    """(медиана мс, пик памяти МБ, результат)"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = path(db)
+        times.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    path(db)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024 / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    with bench_database() as db:
+        populate(db, args.participants)
+        expected = None
+        for title, path in (('все строки', all_rows_path), ('GROUP BY', group_by_path), ('сводная', summary_table_path)):
+            elapsed, peak, result = measure(path, db, args.repeat)
+            # Все три способа должны давать одинаковые итоги
+            expected = expected or result
+            assert result == expected, f"{title}: {result} != {expected}"
+            rows.append([title, f"{args.participants:,}", f"{elapsed:.2f}", f"{peak:.2f}", f"{result[0]} / {result[1]}"])
+
+    report(
+        "Статистика админки",
+        ["способ", "участников", "медиана, мс", "пик памяти, МБ", "всего / активировано"],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
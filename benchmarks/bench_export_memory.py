@@ -0,0 +1,150 @@
+"""
+Память при экспорте участников в CSV и отправке файла через Bot API
+
+    python benchmarks/bench_export_memory.py [--sizes 10000,100000,300000]
+
+Файл отправляется через send_document в локальный поддельный Bot API (uvicorn),
+который читает и отбрасывает тело запроса. Пик памяти Python (tracemalloc)
+замеряется отдельно для записи файла (export_participants_to_csv) и для отправки:
+    целиком         — файл в памяти целиком, как делает PTB для document=файловый объект
+                      (InputFile читает его через read())
+    export_document — InputFile(read_file_handle=False), httpx читает файл частями
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from harness import bench_database, report
+
+TOKEN = '123456:bench'
+
+MESSAGE = {
+    'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+    'document': {'file_id': 'bench', 'file_unique_id': 'bench'},
+}
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+
+
+class FakeBotApi:
+    """ASGI-приложение: getMe и sendDocument, тело запроса читается и отбрасывается"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        while True:
+            message = await receive()
+            self.received += len(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        result = BOT_USER if scope['path'].endswith('/getMe') else MESSAGE
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def start_fake_api(app) -> int:
+    """Запустить uvicorn в отдельном потоке, вернуть порт"""
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+async def send_peak_mb(bot, make_document, filename: str) -> float:
+    """Пик памяти Python (МБ) во время подготовки документа и send_document"""
+    tracemalloc.start()
+    try:
+        await bot.send_document(chat_id=1, document=make_document(), filename=filename)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def export_peak_mb(admin, compression: str):
+    """(файл, имя, пик памяти Python в МБ) для export_participants_to_csv"""
+    tracemalloc.start()
+    try:
+        export_file, filename = admin.export_participants_to_csv(compression)
+        return export_file, filename, tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+async def run(sizes, db, admin, export_document) -> list:
+    from telegram import Bot
+
+    port = start_fake_api(FakeBotApi())
+    rows = []
+    async with Bot(TOKEN, base_url=f'http://127.0.0.1:{port}/bot') as bot:
+        participants = 0
+        for size in sizes:
+            db.bulk_import_participants(
+                {'telegram_id': telegram_id, 'username': f'user{telegram_id}', 'first_name': f'Участник {telegram_id}',
+                 'email': f'user{telegram_id}@example.com', 'zoom_date': '2030-03-01'}
+                for telegram_id in range(participants + 1, size + 1)
+            )
+            participants = size
+
+            for compression in ('', 'gzip'):
+                for mode in ('целиком', 'export_document'):
+                    export_file, filename, write_peak = export_peak_mb(admin, compression)
+                    file_size = export_file.seek(0, os.SEEK_END) / 1024 / 1024
+                    export_file.seek(0)
+
+                    with export_file:
+                        if mode == 'целиком':
+                            make_document = export_file.read
+                        else:
+                            make_document = lambda: export_document(export_file, filename)  # noqa: E731
+                        send_peak = await send_peak_mb(bot, make_document, filename)
+                    rows.append([
+                        f"{size:,}", compression or 'нет', mode, f"{file_size:.1f}",
+                        f"{write_peak:.2f}", f"{send_peak:.2f}",
+                    ])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,300000')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    cwd = os.getcwd()
+    with bench_database() as db, tempfile.TemporaryDirectory() as directory:
+        # admin создаёт свой Database при импорте — в SQLite пусть это будет временный файл
+        os.chdir(directory)
+        try:
+            import admin
+            from bot_admin_handlers import export_document
+            admin.db = db
+            rows = asyncio.run(run(sizes, db, admin, export_document))
+        finally:
+            os.chdir(cwd)
+
+    report(
+        "Экспорт участников: пик памяти Python, МБ",
+        ["участников", "сжатие", "отправка", "файл, МБ", "запись", "отправка"],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
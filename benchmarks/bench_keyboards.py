@@ -0,0 +1,77 @@
+"""
+Клавиатура главного меню: сборка на каждый вызов против готовой из keyboards.get_keyboard
+
+    python benchmarks/bench_keyboards.py [--number 5000] [--repeat 5]
+
+Используются настоящие InlineKeyboardButton / InlineKeyboardMarkup из python-telegram-bot.
+Для каждого языка из TEXTS сравниваются:
+    как было     — шесть кнопок и InlineKeyboardMarkup на каждый вызов show_main_menu
+    get_keyboard — готовый объект из keyboards.KEYBOARDS
+Замеряется только получение разметки и она же вместе с to_json() (его PTB выполняет
+при отправке запроса). Перед замером проверяется, что разметка одинакова.
+БД не используется.
+"""
+
+import argparse
+import timeit
+
+from harness import report
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from keyboards import get_keyboard
+from languages import TEXTS, get_text
+
+
+def old_main_menu(language: str) -> InlineKeyboardMarkup:
+    """Как было в show_main_menu: кнопки собираются заново при каждом вызове"""
+    keyboard = [
+        [InlineKeyboardButton(get_text(language, 'btn_remind_id'), callback_data='menu_remind_id')],
+        [InlineKeyboardButton(get_text(language, 'btn_remind_code'), callback_data='menu_remind_code')],
+        [InlineKeyboardButton(get_text(language, 'btn_remind_date'), callback_data='menu_remind_date')],
+        [InlineKeyboardButton(get_text(language, 'btn_reschedule'), callback_data='menu_reschedule')],
+        [InlineKeyboardButton(get_text(language, 'btn_how_activate'), callback_data='menu_how_activate')],
+        [InlineKeyboardButton(get_text(language, 'btn_change_language'), callback_data='menu_change_language')]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def new_main_menu(language: str) -> InlineKeyboardMarkup:
+    return get_keyboard(language, 'main_menu')
+
+
+def per_call_us(func, language: str, number: int, repeat: int) -> float:
+    """Лучшее время одного вызова func(language) из repeat серий по number вызовов, мкс"""
+    return min(timeit.repeat(lambda: func(language), number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=5_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for language in TEXTS:
+        # Одинаковая разметка — иначе сравнение бессмысленно
+        assert old_main_menu(language).to_json() == new_main_menu(language).to_json(), language
+
+        timings = []
+        for func in (old_main_menu, new_main_menu):
+            timings.append(per_call_us(func, language, args.number, args.repeat))
+            timings.append(per_call_us(lambda lang: func(lang).to_json(), language, args.number, args.repeat))
+        old, old_json, new, new_json = timings
+        rows.append([
+            language, f"{old:.2f}", f"{new:.2f}", f"{old / new:.0f}×",
+            f"{old_json:.2f}", f"{new_json:.2f}",
+        ])
+
+    report(
+        "Клавиатура главного меню, мкс на вызов",
+        ["язык", "как было", "get_keyboard", "ускорение", "как было + to_json", "get_keyboard + to_json"],
+        rows,
+        with_backend=False
+    )
+
+
+if __name__ == '__main__':
+    main()
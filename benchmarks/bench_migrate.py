@@ -0,0 +1,131 @@
+"""
+Перенос участников из SQLite в PostgreSQL: manage_db migrate на 100k строк
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_migrate.py [--participants 100000]
+
+Только PostgreSQL (цель переноса — схема прогона harness). Файл SQLite с --participants
+участниками (даты, языки, часть активирована) строится через Database в отдельном
+процессе без DATABASE_URL. Затем manage_db.main(['migrate', '--sqlite-path', ...])
+выполняется дважды, каждый раз в пустую схему:
+    время   — без tracemalloc
+    память  — под tracemalloc (пик памяти Python; время этого прогона не показательно)
+После каждого прогона проверяется, что в PostgreSQL столько же участников,
+сколько в файле, и что контрольные суммы совпадают.
+Код возврата 1 — если migrate завершился с ошибкой или данные не совпали.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from harness import BACKEND, bench_database, report
+
+LANGUAGES = ['ru', 'en', 'he']
+TYPES = ['participant', 'speaker', 'volunteer']
+DATES = [f'2030-07-{day:02d}' for day in range(1, 15)]
+
+
+def build_sqlite(path: str, count: int):
+    """Файл SQLite с count участниками (запускается в процессе без DATABASE_URL)"""
+    from database import Database
+
+    db = Database(path)
+    try:
+        for zoom_date in DATES:
+            db.set_date_capacity(zoom_date, count)
+        rng = random.Random(19)
+        db.bulk_import_participants(
+            {
+                'telegram_id': telegram_id,
+                'username': f'user{telegram_id}',
+                'first_name': f'Участник {telegram_id}',
+                'email': f'user{telegram_id}@example.com',
+                'language': rng.choice(LANGUAGES),
+                'participant_type': rng.choice(TYPES),
+                'zoom_date': rng.choice(DATES + [None]),
+            }
+            for telegram_id in range(1, count + 1)
+        )
+        with db.connection() as conn:
+            codes = [row['activation_code'] for row in conn.execute(
+                "SELECT activation_code FROM participants WHERE telegram_id % 5 < 2"
+            ).fetchall()]
+        db.activate_users_bulk(codes)
+    finally:
+        db.close()
+
+
+def migrate(path: str, traced: bool) -> tuple:
+    """(код возврата manage_db, секунд, пик памяти Python в МБ или None)"""
+    import manage_db
+
+    if traced:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        status = manage_db.main(['migrate', '--sqlite-path', path])
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if traced else None
+    finally:
+        if traced:
+            tracemalloc.stop()
+    return status, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, default=100_000)
+    parser.add_argument('--build-sqlite', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build_sqlite:
+        build_sqlite(args.build_sqlite, args.participants)
+        return 0
+    if BACKEND != 'postgres':
+        parser.error("нужен PostgreSQL: задайте DATABASE_URL")
+
+    rows = []
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'source.db')
+        env = {name: value for name, value in os.environ.items()
+               if name not in ('DATABASE_URL', 'BENCH_DATABASE_URL')}
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, __file__, '--build-sqlite', path, '--participants', str(args.participants)],
+            env=env, check=True
+        )
+        build_time = time.perf_counter() - started
+        file_size = os.path.getsize(path) / 1024 / 1024
+
+        from manage_db import iter_sqlite_participants
+        from database import STREAM_BATCH_SIZE, checksum_rows
+        expected = checksum_rows(iter_sqlite_participants(path, STREAM_BATCH_SIZE))
+
+        for title, traced in (('время', False), ('память', True)):
+            with bench_database() as db:
+                status, elapsed, peak = migrate(path, traced)
+                migrated = db.participants_checksum()
+            run_ok = status == 0 and migrated == expected
+            ok = ok and run_ok
+            rows.append([
+                title, f"{args.participants:,}", f"{file_size:.1f}", f"{elapsed:.1f}",
+                f"{args.participants / elapsed:,.0f}", "—" if peak is None else f"{peak:.1f}",
+                "OK" if run_ok else "FAIL",
+            ])
+
+    report(
+        f"manage_db migrate: SQLite → PostgreSQL (файл построен за {build_time:.0f} с)",
+        ["прогон", "участников", "файл SQLite, МБ", "секунд", "строк/с", "пик памяти, МБ", "итог"],
+        rows
+    )
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
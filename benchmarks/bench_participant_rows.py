@@ -0,0 +1,100 @@
+"""
+Строки участников в памяти: dict(SELECT *) против Participant (namedtuple) с проекцией колонок
+
+    python benchmarks/bench_participant_rows.py [--participants 100000] [--repeat 3]
+
+Все участники записаны на одну дату; список участников даты получается четырьмя способами:
+    dict(SELECT *)          — SELECT * в список dict (как было)
+    Participant, все        — get_participants_by_date без columns
+    Participant, 2 колонки  — ('language', 'is_activated'), как в карточке даты админки
+    Participant, 1 колонка  — ('telegram_id',), как в списке получателей рассылки
+Для каждого — медиана времени из --repeat прогонов (без tracemalloc), а также
+память Python (tracemalloc): сколько занимает готовый список и пик во время выборки.
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from harness import bench_database, report
+
+ZOOM_DATE = '2030-05-01'
+
+
+def populate(db, count: int):
+    db.set_date_capacity(ZOOM_DATE, count)
+    db.bulk_import_participants(
+        {
+            'telegram_id': telegram_id,
+            'username': f'user{telegram_id}',
+            'first_name': f'Участник {telegram_id}',
+            'email': f'user{telegram_id}@example.com',
+            'zoom_date': ZOOM_DATE,
+        }
+        for telegram_id in range(1, count + 1)
+    )
+
+
+def dict_rows_path(db):
+    """Как было: SELECT * и dict на каждую строку"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(db._p(
+            "SELECT * FROM participants WHERE zoom_date = %s ORDER BY registration_date"
+        ), (ZOOM_DATE,))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def participant_path(columns):
+    def path(db):
+        return db.get_participants_by_date(ZOOM_DATE, columns)
+    return path
+
+
+def measure(path, db, repeat: int):
+    """(медиана мс, удержано МБ, пик МБ, строк)"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = path(db)
+        times.append((time.perf_counter() - started) * 1000)
+        del rows
+
+    tracemalloc.start()
+    rows = path(db)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), retained / 1024 / 1024, peak / 1024 / 1024, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = [
+        ('dict(SELECT *)', dict_rows_path),
+        ('Participant, все колонки', participant_path(None)),
+        ('Participant, language + is_activated', participant_path(('language', 'is_activated'))),
+        ('Participant, telegram_id', participant_path(('telegram_id',))),
+    ]
+    rows = []
+    with bench_database() as db:
+        populate(db, args.participants)
+        for title, path in paths:
+            elapsed, retained, peak, count = measure(path, db, args.repeat)
+            # Каждый способ должен вернуть всех участников даты
+            assert count == args.participants, f"{title}: {count} строк из {args.participants}"
+            rows.append([title, f"{count:,}", f"{elapsed:.0f}", f"{retained:.1f}", f"{peak:.1f}"])
+
+    report(
+        f"Участники даты: {args.participants:,} строк",
+        ["строки", "участников", "медиана, мс", "удержано, МБ", "пик, МБ"],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
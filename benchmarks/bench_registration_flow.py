@@ -0,0 +1,222 @@
+"""
+Регистрация 500 пользователей через обработчики бота: последовательно и параллельно
+
+    python benchmarks/bench_registration_flow.py [--users 500] [--latency 0.02] [--concurrency 64]
+
+Каждый пользователь проходит регистрацию как в Telegram: /start → выбор языка →
+выбор даты (три обновления его чата; все обновления сразу ставятся в update_queue).
+Обрабатывает их настоящий Application с обработчиками из bot.add_handlers,
+ответы уходят в поддельный Bot API (uvicorn в отдельном потоке), который отвечает
+с задержкой --latency секунд, как сеть до api.telegram.org. Сравниваются:
+    последовательно   — Application по умолчанию (одно обновление за раз)
+    PerChatUpdateProcessor(--concurrency) — чаты параллельно, внутри чата по порядку
+После прогона проверяется, что все пользователи зарегистрированы с датой: если бы
+обновления чата обработались не по порядку, ConversationHandler пропустил бы шаги.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from urllib.parse import parse_qs
+
+from harness import bench_database, report
+
+TOKEN = '123456:bench'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+
+
+class FakeBotApi:
+    """ASGI-приложение Bot API: отвечает через latency секунд, считает вызовы по методам"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        method = scope['path'].rsplit('/', 1)[-1]
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == 'getMe':
+            result = BOT_USER
+        else:
+            await asyncio.sleep(self.latency)
+            if method == 'answerCallbackQuery':
+                result = True
+            else:
+                # PTB отправляет параметры формой (application/x-www-form-urlencoded)
+                params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                result = {
+                    'message_id': 1, 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': int(params.get('chat_id', 1)), 'type': 'private'},
+                }
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+def start_fake_api(app) -> int:
+    """Запустить uvicorn в отдельном потоке, вернуть порт"""
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+def registration_updates(telegram_id: int, update_id: int, zoom_date: str) -> list:
+    """Три обновления регистрации одного пользователя (как их присылает Telegram)"""
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': f'user {telegram_id}', 'username': f'u{telegram_id}'}
+    chat = {'id': telegram_id, 'type': 'private'}
+    bot_message = {'message_id': 2, 'date': int(time.time()), 'chat': chat, 'text': '...',
+                   'from': BOT_USER}
+
+    def callback(offset: int, data: str) -> dict:
+        return {'update_id': update_id + offset, 'callback_query': {
+            'id': f'{telegram_id}-{offset}', 'from': user, 'chat_instance': str(telegram_id),
+            'data': data, 'message': bot_message,
+        }}
+
+    return [
+        {'update_id': update_id, 'message': {
+            'message_id': 1, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        }},
+        callback(1, 'lang_ru'),
+        callback(2, f'date_{zoom_date}'),
+    ]
+
+
+async def run_flow(bot_module, port: int, processor, first_id: int, users: int, dates: list) -> float:
+    """Секунд на обработку всех обновлений users пользователей"""
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    builder = Application.builder().token(TOKEN).base_url(f'http://127.0.0.1:{port}/bot').updater(None)
+    if processor is not None:
+        builder = builder.concurrent_updates(processor)
+    application = builder.build()
+    bot_module.add_handlers(application)
+
+    # Счётчик обработанных обновлений: группа после обработчиков бота
+    total = 3 * users
+    done = asyncio.Event()
+    processed = 0
+
+    async def count(update, context):
+        nonlocal processed
+        processed += 1
+        if processed == total:
+            done.set()
+
+    application.add_handler(TypeHandler(Update, count), group=1)
+
+    async with application:
+        updates = []
+        for i in range(users):
+            telegram_id = first_id + i
+            updates += registration_updates(telegram_id, 3 * telegram_id, dates[i % len(dates)])
+        # Обновления чатов вперемешку, внутри чата — по порядку (как из getUpdates)
+        ordered = [Update.de_json(data, application.bot) for data in interleave(updates, users)]
+
+        await application.start()
+        started = time.perf_counter()
+        for update in ordered:
+            await application.update_queue.put(update)
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    return elapsed
+
+
+def interleave(updates: list, users: int) -> list:
+    """Шаг 1 всех пользователей, затем шаг 2 всех, затем шаг 3"""
+    return [updates[3 * user + step] for step in range(3) for user in range(users)]
+
+
+def registered(db, first_id: int, users: int) -> int:
+    """Сколько из пользователей зарегистрированы с датой"""
+    return sum(
+        1 for telegram_id in range(first_id, first_id + users)
+        if (db.get_user(telegram_id) or {}).get('zoom_date')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help="задержка ответа Bot API, секунды")
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    rows = []
+    ok = True
+    cwd = os.getcwd()
+    with bench_database() as db, tempfile.TemporaryDirectory() as directory:
+        # bot создаёт свой Database при импорте — в SQLite пусть это будет временный файл
+        os.chdir(directory)
+        try:
+            import bot
+            from database import AsyncDatabase
+            from date_picker import get_next_three_days
+            from telegram.warnings import PTBUserWarning
+            from update_processor import PerChatUpdateProcessor
+            logging.getLogger().setLevel(logging.WARNING)
+            # per_message у ConversationHandler бота — как в рабочем запуске
+            warnings.filterwarnings('ignore', category=PTBUserWarning)
+
+            bot.db = bot.media.db = AsyncDatabase(db)
+            dates = [day.strftime('%Y-%m-%d') for day in get_next_three_days()]
+            for zoom_date in dates:
+                db.set_date_capacity(zoom_date, 10 * args.users)
+
+            api = FakeBotApi(args.latency)
+            port = start_fake_api(api)
+            modes = [
+                ('последовательно', None),
+                (f'PerChatUpdateProcessor({args.concurrency})', PerChatUpdateProcessor(args.concurrency)),
+            ]
+            for index, (title, processor) in enumerate(modes):
+                first_id = 1_000_000 * (index + 1)
+                calls_before = sum(api.calls.values())
+                elapsed = asyncio.run(run_flow(bot, port, processor, first_id, args.users, dates))
+                done = registered(db, first_id, args.users)
+                ok = ok and done == args.users
+                rows.append([
+                    title, args.users, f"{elapsed:.2f}", f"{args.users / elapsed:.1f}",
+                    sum(api.calls.values()) - calls_before, f"{done}/{args.users}",
+                ])
+        finally:
+            os.chdir(cwd)
+
+    report(
+        f"Регистрация через обработчики бота, задержка Bot API {args.latency * 1000:.0f} мс",
+        ["обработка", "пользователей", "секунд", "регистраций/с", "вызовов Bot API", "зарегистрировано"],
+        rows
+    )
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+SQLite: смешанная нагрузка чтение/запись до и после WAL + потока-писателя
+
+    python benchmarks/bench_sqlite_mixed.py [--threads 16] [--seconds 10] [--participants 10000] [--timeout 5]
+
+Только SQLite (запускать без DATABASE_URL). --threads потоков в течение --seconds
+выполняют случайные операции: 80% чтение участника, 20% смена языка.
+    до     — как было: у каждого потока своё соединение в режиме rollback journal,
+             запись (UPDATE + commit) прямо из потока, timeout соединения = --timeout
+    после  — Database: WAL, чтения из соединений потоков, запись через SQLiteWriter
+             (_read_user — чтение из БД мимо кэша, set_user_language)
+Обе схемы работают с одинаковыми данными (копия файла через VACUUM INTO).
+Выводятся операции в секунду и число ошибок "database is locked".
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import threading
+import time
+
+LANGUAGES = ['ru', 'en', 'he']
+
+
+def run_load(threads: int, seconds: float, participants: int, read, write) -> tuple:
+    """(операций, ошибок "database is locked", секунд)"""
+    counters = {'ops': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        ops = locked = 0
+        while time.perf_counter() < stop_at:
+            telegram_id = rng.randint(1, participants)
+            try:
+                if rng.random() < 0.8:
+                    read(telegram_id)
+                else:
+                    write(telegram_id, rng.choice(LANGUAGES))
+                ops += 1
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+        with lock:
+            counters['ops'] += ops
+            counters['locked'] += locked
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return counters['ops'], counters['locked'], time.perf_counter() - started
+
+
+def rollback_journal_path(path: str, timeout: float):
+    """read / write как до изменения: соединение на поток, rollback journal, запись из потока"""
+    local = threading.local()
+
+    def connection() -> sqlite3.Connection:
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = sqlite3.connect(path, timeout=timeout)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    def read(telegram_id: int):
+        conn = connection()
+        try:
+            row = conn.execute("SELECT * FROM participants WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.commit()
+
+    def write(telegram_id: int, language: str):
+        conn = connection()
+        try:
+            conn.execute("UPDATE participants SET language = ? WHERE telegram_id = ?", (language, telegram_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return read, write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--participants', type=int, default=10_000)
+    parser.add_argument('--timeout', type=float, default=5, help="SQLITE_TIMEOUT, секунды")
+    args = parser.parse_args()
+
+    # До импорта database (через harness): таймаут соединений Database
+    os.environ['SQLITE_TIMEOUT'] = str(args.timeout)
+    from harness import BACKEND, bench_database, report
+
+    if BACKEND != 'sqlite':
+        parser.error("только SQLite: запустите без DATABASE_URL")
+
+    rows = []
+    with bench_database() as db:
+        db.bulk_import_participants(
+            {'telegram_id': telegram_id, 'first_name': f'user {telegram_id}'}
+            for telegram_id in range(1, args.participants + 1)
+        )
+        before_path = db.db_path + '.before'
+        with db.connection() as conn:
+            conn.execute("VACUUM INTO ?", (before_path,))
+        with sqlite3.connect(before_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+        paths = [
+            ('до: rollback journal', rollback_journal_path(before_path, args.timeout)),
+            ('после: WAL + поток-писатель', (db._read_user, db.set_user_language)),
+        ]
+        for title, (read, write) in paths:
+            ops, locked, elapsed = run_load(args.threads, args.seconds, args.participants, read, write)
+            rows.append([title, args.threads, f"{ops / elapsed:,.0f}", locked])
+
+    report(
+        f"Чтение 80% / запись 20%, {args.participants:,} участников, SQLITE_TIMEOUT={args.timeout:g}",
+        ["схема", "потоков", "операций/с", "database is locked"],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
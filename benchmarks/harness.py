@@ -0,0 +1,91 @@
+"""
+Общее для нагрузочных скриптов: временная БД и замер времени
+
+Запуск из корня репозитория:
+    python benchmarks/<скрипт>.py                                  — SQLite (временный файл)
+    DATABASE_URL=postgresql://... python benchmarks/<скрипт>.py    — PostgreSQL
+
+В PostgreSQL скрипт работает в отдельной схеме bench_<pid>, которая удаляется
+после прогона: таблицы самой базы не затрагиваются (но нагрузка на сервер реальная,
+запускайте на тестовой базе).
+"""
+
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(ROOT, '.env'))
+
+# Исходный адрес сохраняется для дочерних процессов скрипта (у них DATABASE_URL уже со схемой)
+DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+BENCH_SCHEMA = os.environ.setdefault("BENCH_SCHEMA", f"bench_{os.getpid()}")
+
+if DATABASE_URL:
+    # Все соединения пула бота — в схеме прогона (до импорта database)
+    separator = '&' if '?' in DATABASE_URL else '?'
+    os.environ["BENCH_DATABASE_URL"] = DATABASE_URL
+    os.environ["DATABASE_URL"] = f"{DATABASE_URL}{separator}options=-csearch_path%3D{BENCH_SCHEMA}"
+
+from database import Database  # noqa: E402
+
+BACKEND = 'postgres' if DATABASE_URL else 'sqlite'
+
+
+@contextmanager
+def bench_database():
+    """Database на пустой временной БД (со всеми миграциями); удаляется после прогона"""
+    if DATABASE_URL:
+        import psycopg
+        with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+            conn.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        db = None
+        try:
+            db = Database()
+            yield db
+        finally:
+            if db is not None:
+                db.close()
+            with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+                conn.execute(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE")
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            db = Database(os.path.join(directory, 'bench.db'))
+            try:
+                yield db
+            finally:
+                db.close()
+
+
+@contextmanager
+def timer(results: Dict[str, float], name: str):
+    """Записать время блока (секунды) в results[name]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[name] = time.perf_counter() - started
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(title: str, header: List[str], rows: List[List], with_backend: bool = True):
+    """Таблица результатов в stdout (Markdown, чтобы вставлять в описание изменений)"""
+    print(f"\n{title} [{BACKEND}]\n" if with_backend else f"\n{title}\n")
+    print("| " + " | ".join(header) + " |")
+    print("|" + "|".join("---" for _ in header) + "|")
+    for row in rows:
+        print("| " + " | ".join(str(value) for value in row) + " |")
@@ -0,0 +1,172 @@
+"""
+Нагрузочный тест приёма обновлений через webhook (webhook_server.WebhookApp)
+
+    python benchmarks/load_webhook.py [--updates 20000] [--concurrency 64]
+
+Поддельный отправитель вместо Telegram шлёт POST (HTTP/1.1 keep-alive) на WebhookApp
+под uvicorn (локальный порт) с --concurrency одновременных соединений:
+    верный секрет   — все ответы 200, каждое обновление попадает в update_queue ровно один раз
+    неверный секрет — все ответы 403, в очередь ничего не попадает
+    большое тело    — ответ 413
+Очередь разбирает отдельная задача (обработчики бота не вызываются: замеряется
+только приём). Отправитель работает в отдельном процессе, чтобы не делить GIL с сервером.
+Код возврата 1 — если ответы или число обновлений в очереди не совпали с ожидаемыми.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from harness import percentile, report
+
+TOKEN = '123456:load'
+SECRET = 'load-test-secret'
+PATH = '/telegram'
+
+
+def make_update(update_id: int) -> bytes:
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': '/start',
+            'chat': {'id': update_id, 'type': 'private'},
+            'from': {'id': update_id, 'is_bot': False, 'first_name': f'user {update_id}'},
+        },
+    }).encode()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def post(reader, writer, host: str, body: bytes, secret: str) -> int:
+    """Один POST по открытому keep-alive соединению, вернуть статус ответа"""
+    writer.write(
+        f"POST {PATH} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    length = next(int(line.split(':', 1)[1]) for line in lines if line.lower().startswith('content-length:'))
+    await reader.readexactly(length)
+    return int(lines[0].split()[1])
+
+
+async def send_all(port: int, bodies: list, secret: str, concurrency: int):
+    """(статусы ответов, задержки в мс, секунд на всё): concurrency соединений разбирают общий список"""
+    statuses, latencies = [], []
+    pending = iter(bodies)
+    host = f'127.0.0.1:{port}'
+
+    async def sender():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            for body in pending:
+                started = time.perf_counter()
+                statuses.append(await post(reader, writer, host, body, secret))
+                latencies.append((time.perf_counter() - started) * 1000)
+                if statuses[-1] == 413:
+                    # Сервер отвечает, не дочитав тело, — соединение дальше не годится
+                    writer.close()
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return statuses, latencies, time.perf_counter() - started
+
+
+def sender_process(port: int, bodies: list, secret: str, concurrency: int):
+    return asyncio.run(send_all(port, bodies, secret, concurrency))
+
+
+async def run(updates: int, concurrency: int) -> tuple:
+    import uvicorn
+    from telegram.ext import Application
+
+    from webhook_server import MAX_BODY_SIZE, WebhookApp
+
+    application = Application.builder().token(TOKEN).updater(None).build()
+    app = WebhookApp(application, SECRET, PATH)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='error', access_log=False))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Разбор очереди: update_id каждого принятого обновления
+    queued = []
+
+    async def drain():
+        while True:
+            update = await application.update_queue.get()
+            queued.append(update.update_id)
+
+    draining = asyncio.create_task(drain())
+    executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+    rows = []
+    ok = True
+
+    scenarios = [
+        ('верный секрет', [make_update(i) for i in range(1, updates + 1)], SECRET, 200, updates),
+        ('неверный секрет', [make_update(i) for i in range(1, updates // 10 + 1)], 'wrong', 403, 0),
+        ('большое тело', [b'{"update_id": 1, "x": "' + b'x' * MAX_BODY_SIZE + b'"}'] * 10, SECRET, 413, 0),
+    ]
+    for title, bodies, secret, expected_status, expected_queued in scenarios:
+        before = len(queued)
+        statuses, latencies, elapsed = await asyncio.get_running_loop().run_in_executor(
+            executor, sender_process, port, bodies, secret, concurrency
+        )
+        # Всё, что принято с 200, уже в очереди — дать задаче разбора её дочитать
+        while application.update_queue.qsize():
+            await asyncio.sleep(0.01)
+
+        accepted = queued[before:]
+        scenario_ok = (
+            statuses.count(expected_status) == len(bodies)
+            and len(accepted) == expected_queued
+            and len(set(accepted)) == len(accepted)
+        )
+        ok = ok and scenario_ok
+        rows.append([
+            title, len(bodies), ", ".join(f"{status}: {statuses.count(status)}" for status in sorted(set(statuses))),
+            len(accepted), f"{len(bodies) / elapsed:,.0f}",
+            f"{statistics.median(latencies):.2f}", f"{percentile(latencies, 0.95):.2f}",
+            f"{percentile(latencies, 0.99):.2f}", "OK" if scenario_ok else "FAIL",
+        ])
+
+    executor.shutdown()
+    draining.cancel()
+    server.should_exit = True
+    await serving
+    return rows, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20_000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    rows, ok = asyncio.run(run(args.updates, args.concurrency))
+    report(
+        f"Приём webhook: {args.concurrency} одновременных соединений",
+        ["запросы", "отправлено", "ответы", "в очереди", "запросов/с", "p50, мс", "p95, мс", "p99, мс", "итог"],
+        rows,
+        with_backend=False
+    )
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
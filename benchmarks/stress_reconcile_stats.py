@@ -0,0 +1,105 @@
+"""
+Стресс-тест пересчёта сводных счётчиков под нагрузкой записи
+
+    python benchmarks/stress_reconcile_stats.py [--participants 20000] [--threads 8] [--seconds 20]
+
+Потоки непрерывно меняют язык участников и переносят их на другую дату (счётчики
+registration_stats и date_capacity меняются в каждой транзакции), один поток
+в это же время в цикле вызывает reconcile_registration_stats и reconcile_date_capacity.
+Вместимость каждой даты — число участников, так что переносы не упираются в лимит;
+у каждого потока свои участники, и дата всегда меняется на другую.
+Проверяется, что не было ошибок (в PostgreSQL — deadlock detected), что переносы
+действительно были и что после нагрузки счётчики совпадают с таблицей участников
+без повторного пересчёта.
+Код возврата 1 — если были ошибки, не было ни одного переноса или счётчики разошлись.
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from harness import bench_database, report
+
+LANGUAGES = ['ru', 'en', 'he']
+DATES = [f'2030-04-{day:02d}' for day in range(1, 8)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--participants', type=int, default=20_000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    args = parser.parse_args()
+
+    errors = []
+    counters = {'writes': 0, 'moves': 0, 'reconciles': 0}
+
+    with bench_database() as db:
+        for zoom_date in DATES:
+            db.set_date_capacity(zoom_date, args.participants)
+        rng = random.Random(7)
+        current = {telegram_id: rng.choice(DATES) for telegram_id in range(1, args.participants + 1)}
+        db.bulk_import_participants(
+            {'telegram_id': telegram_id, 'language': rng.choice(LANGUAGES), 'zoom_date': zoom_date}
+            for telegram_id, zoom_date in current.items()
+        )
+        stop_at = time.time() + args.seconds
+
+        def writer(seed: int):
+            rng = random.Random(seed)
+            # Участники потока: telegram_id % threads == seed (их дату меняет только он)
+            own = list(range(seed or args.threads, args.participants + 1, args.threads))
+            while time.time() < stop_at:
+                telegram_id = rng.choice(own)
+                zoom_date = rng.choice([d for d in DATES if d != current[telegram_id]])
+                try:
+                    db.set_user_language(telegram_id, rng.choice(LANGUAGES))
+                    counters['writes'] += 1
+                    if db.reserve_seat(telegram_id, zoom_date):
+                        current[telegram_id] = zoom_date
+                        counters['moves'] += 1
+                    counters['writes'] += 1
+                except Exception as e:
+                    errors.append(repr(e))
+
+        def reconciler():
+            while time.time() < stop_at:
+                try:
+                    db.reconcile_registration_stats()
+                    db.reconcile_date_capacity()
+                    counters['reconciles'] += 1
+                except Exception as e:
+                    errors.append(repr(e))
+
+        threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(args.threads)]
+        threads.append(threading.Thread(target=reconciler))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Счётчики после нагрузки должны совпасть с пересчитанными заново
+        counts = db.get_participant_counts()
+        capacity = db.get_dates_capacity(DATES)
+        db.reconcile_registration_stats()
+        stats_ok = sorted(counts, key=repr) == sorted(db.get_participant_counts(), key=repr)
+        booked_ok = all(capacity[zoom_date]['booked'] == db.count_participants({'zoom_date': zoom_date})
+                        for zoom_date in DATES)
+
+    ok = not errors and counters['moves'] > 0 and stats_ok and booked_ok
+    report(
+        f"Пересчёт счётчиков под нагрузкой: {args.threads} потоков записи, {args.seconds:.0f} с",
+        ["записей", "переносов", "пересчётов", "ошибок", "registration_stats", "date_capacity", "итог"],
+        [[counters['writes'], counters['moves'], counters['reconciles'], len(errors),
+          "сходится" if stats_ok else "расходится", "сходится" if booked_ok else "расходится",
+          "OK" if ok else "FAIL"]]
+    )
+    for error in errors[:3]:
+        print(error[:300])
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
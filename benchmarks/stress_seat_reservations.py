@@ -0,0 +1,144 @@
+"""
+Стресс-тест записи на дату: 1000 одновременных попыток на дату с 290 местами
+
+    python benchmarks/stress_seat_reservations.py [--attempts 1000] [--capacity 290] [--processes 4] [--threads 32]
+
+Попытки идут из нескольких процессов (как бот, email-бот и админка) и потоков
+одновременно:
+    1. register — новые участники сразу с датой A (register_participant)
+    2. reserve  — reserve_seat на дату B: записанные на A переносятся (место на A
+       освобождается), остальные записываются впервые
+    3. swap     — встречные переносы: записанные на A — на B, записанные на B — на A
+       (места на обеих датах есть; в PostgreSQL так проверяется порядок блокировок)
+После каждой фазы проверяется, что успешных попыток ровно столько, сколько мест
+(в фазе swap — сколько участников), что ни одна попытка не упала с ошибкой (deadlock)
+и что date_capacity.booked по каждой дате совпадает с числом участников на ней.
+Код возврата 1 — если лимит нарушен, были ошибки или счётчики разошлись.
+"""
+
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import Database, bench_database, report
+
+DATE_A = '2030-01-07'
+DATE_B = '2030-01-08'
+
+FIRST_TELEGRAM_ID = 5_000_000
+
+
+def attempt(db, operation: str, target) -> object:
+    """True / False — результат попытки, строка — текст исключения"""
+    try:
+        if operation == 'register':
+            return db.register_participant(target, None, 'stress', 'participant', zoom_date=DATE_A) is not None
+        if operation == 'reserve':
+            return db.reserve_seat(target, DATE_B)
+        telegram_id, zoom_date = target
+        return db.reserve_seat(telegram_id, zoom_date)
+    except Exception as e:
+        return repr(e)
+
+
+def worker(db_path: str, operation: str, targets: list, threads: int, start_at: float) -> list:
+    """Один процесс: свой Database (свой пул или поток-писатель), попытки из threads потоков"""
+    db = Database(db_path)
+    try:
+        time.sleep(max(0.0, start_at - time.time()))
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(lambda target: attempt(db, operation, target), targets))
+    finally:
+        db.close()
+
+
+def run_phase(db_path: str, operation: str, targets: list, processes: int, threads: int):
+    """(успешных попыток, ошибок, секунд) — все процессы начинают одновременно"""
+    context = multiprocessing.get_context('spawn')
+    parts = [targets[i::processes] for i in range(processes)]
+    with context.Pool(processes) as pool:
+        # Запас на запуск процессов и открытие соединений
+        start_at = time.time() + 3
+        results = pool.starmap(worker, [(db_path, operation, part, threads, start_at) for part in parts])
+        elapsed = time.time() - start_at
+    outcomes = [outcome for part in results for outcome in part]
+    errors = [outcome for outcome in outcomes if isinstance(outcome, str)]
+    for error in errors[:3]:
+        print(error[:300])
+    return outcomes.count(True), len(errors), elapsed
+
+
+def check_dates(db) -> list:
+    """[(дата, вместимость, booked, участников на дате)] по всем датам"""
+    capacity = db.get_dates_capacity([DATE_A, DATE_B])
+    return [
+        (zoom_date, capacity[zoom_date]['capacity'], capacity[zoom_date]['booked'],
+         db.count_participants({'zoom_date': zoom_date}))
+        for zoom_date in (DATE_A, DATE_B)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--attempts', type=int, default=1000)
+    parser.add_argument('--capacity', type=int, default=290)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    rows = []
+
+    def record(title: str, attempts: int, expected: int, result: tuple) -> bool:
+        succeeded, errors, elapsed = result
+        dates = check_dates(db)
+        consistent = all(booked == actual and booked <= capacity for _, capacity, booked, actual in dates)
+        ok = succeeded == expected and not errors and consistent
+        rows.append([
+            title, attempts, succeeded, expected, errors,
+            ", ".join(f"{zoom_date}: {booked}/{actual}" for zoom_date, _, booked, actual in dates),
+            f"{elapsed:.2f}", "OK" if ok else "FAIL",
+        ])
+        return ok
+
+    with bench_database() as db:
+        db.set_date_capacity(DATE_A, args.capacity)
+        db.set_date_capacity(DATE_B, args.capacity)
+
+        # Фаза 1: новые участники сразу с датой A
+        registering = list(range(FIRST_TELEGRAM_ID, FIRST_TELEGRAM_ID + args.attempts))
+        result = run_phase(db.db_path, 'register', registering, args.processes, args.threads)
+        ok = record('register → A', len(registering), args.capacity, result)
+
+        # Фаза 2: записанные на A и ещё не записанные (импорт без даты) — все на B
+        on_a = [row.telegram_id for row in db.iter_participants({'zoom_date': DATE_A}, columns=('telegram_id',))]
+        newcomers = range(FIRST_TELEGRAM_ID + args.attempts, FIRST_TELEGRAM_ID + 2 * args.attempts - len(on_a))
+        db.bulk_import_participants({'telegram_id': telegram_id} for telegram_id in newcomers)
+        reserving = on_a + list(newcomers)
+        result = run_phase(db.db_path, 'reserve', reserving, args.processes, args.threads)
+        ok = record('reserve → B', len(reserving), args.capacity, result) and ok
+
+        # Фаза 3: встречные переносы A→B и B→A, мест хватает всем
+        swapping = [
+            (row.telegram_id, DATE_B if row.zoom_date and str(row.zoom_date) == DATE_A else DATE_A)
+            for zoom_date in (DATE_A, DATE_B)
+            for row in db.iter_participants({'zoom_date': zoom_date}, columns=('telegram_id', 'zoom_date'))
+        ]
+        db.set_date_capacity(DATE_A, 2 * args.capacity)
+        db.set_date_capacity(DATE_B, 2 * args.capacity)
+        random.Random(6).shuffle(swapping)
+        result = run_phase(db.db_path, 'swap', swapping, args.processes, args.threads)
+        ok = record('swap A ↔ B', len(swapping), len(swapping), result) and ok
+
+    report(
+        f"Одновременная запись на дату: {args.processes} процесса × {args.threads} потоков",
+        ["фаза", "попыток", "успешно", "ожидалось", "ошибок", "booked / участников по датам", "сек", "итог"],
+        rows
+    )
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
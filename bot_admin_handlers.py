@@ -3,9 +3,10 @@
 /admin, /stats, /sendlink, /export, /activate, /broadcast
 """
 
+import asyncio
 import logging
 from typing import List
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.error import TelegramError
 
@@ -16,7 +17,8 @@ from admin import (
     export_participants_to_csv,
     export_participants_by_date_to_csv,
     activate_participants_bulk,
-    get_telegram_ids_by_category
+    count_participants,
+    get_telegram_ids_page
 )
 
 logger = logging.getLogger(__name__)
@@ -27,12 +29,35 @@ ADMIN_IDS = [386965305]  # Ваш ID
 # Состояния для ConversationHandler
 ADMIN_MENU, SENDING_LINK, ACTIVATING_CODES, BROADCASTING = range(4)
 
+# Сколько ненайденных кодов перечислять в ответе (лимит длины сообщения Telegram)
+MAX_CODES_IN_REPLY = 200
+
+
+def export_document(export_file, filename: str) -> InputFile:
+    """
+    Файл экспорта для send_document: при отправке читается частями (с диска),
+    а не загружается в память целиком, как файловый объект по умолчанию
+    """
+    return InputFile(export_file, filename=filename, read_file_handle=False)
+
 
 def is_admin(user_id: int) -> bool:
     """Проверка, является ли пользователь админом"""
     return user_id in ADMIN_IDS
 
 
+async def iter_recipient_ids(filters: dict):
+    """Telegram ID получателей рассылки страницами (в памяти — не больше одной страницы)"""
+    after_id = None
+    while True:
+        page = await asyncio.to_thread(get_telegram_ids_page, filters, after_id)
+        if not page:
+            return
+        for telegram_id in page:
+            yield telegram_id
+        after_id = page[-1]
+
+
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Главное меню админки"""
     user_id = update.effective_user.id
@@ -72,7 +97,7 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     # Статистика
     if action == 'admin_stats':
-        stats = get_statistics()
+        stats = await asyncio.to_thread(get_statistics)
         
         text = (
             "📊 **СТАТИСТИКА**\n\n"
@@ -95,7 +120,7 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     # Участники по датам
     elif action == 'admin_dates':
-        dates = get_dates_with_counts()
+        dates = await asyncio.to_thread(get_dates_with_counts)
         
         if not dates:
             text = "📅 Нет зарегистрированных участников."
@@ -120,16 +145,16 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     # Подробности по дате
     elif action.startswith('admin_date_'):
         date = action.replace('admin_date_', '')
-        participants = get_participants_by_date(date)
+        participants = await asyncio.to_thread(get_participants_by_date, date, ('language', 'is_activated'))
         
         text = f"📅 **Дата: {date}**\n\n"
         text += f"Всего участников: {len(participants)}\n"
-        text += f"Активировано: {sum(1 for p in participants if p.get('is_activated'))}\n\n"
+        text += f"Активировано: {sum(1 for p in participants if p.is_activated)}\n\n"
         
         # По языкам
         by_lang = {}
         for p in participants:
-            lang = p.get('language', 'ru')
+            lang = p.language
             by_lang[lang] = by_lang.get(lang, 0) + 1
         
         text += "**По языкам:**\n"
@@ -150,15 +175,15 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     elif action == 'admin_export':
         await query.edit_message_text("📤 Экспортирую данные...")
         
-        csv_data = export_participants_to_csv()
-        filename = f"participants_all_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        # Выборка и запись файла идут в отдельном потоке, event loop не блокируется
+        export_file, filename = await asyncio.to_thread(export_participants_to_csv)
         
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=csv_data.getvalue().encode('utf-8-sig'),
-            filename=filename,
-            caption="📊 Экспорт всех участников"
-        )
+        with export_file:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=export_document(export_file, filename),
+                caption="📊 Экспорт всех участников"
+            )
         
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data='admin_back')]]
         await query.message.reply_text("✅ Экспорт завершён!", reply_markup=InlineKeyboardMarkup(keyboard))
@@ -168,22 +193,21 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         date = action.replace('admin_export_', '')
         await query.edit_message_text(f"📤 Экспортирую данные за {date}...")
         
-        csv_data = export_participants_by_date_to_csv(date)
-        filename = f"participants_{date}.csv"
+        export_file, filename = await asyncio.to_thread(export_participants_by_date_to_csv, date)
         
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=csv_data.getvalue().encode('utf-8-sig'),
-            filename=filename,
-            caption=f"📊 Участники на {date}"
-        )
+        with export_file:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=export_document(export_file, filename),
+                caption=f"📊 Участники на {date}"
+            )
         
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data='admin_dates')]]
         await query.message.reply_text("✅ Экспорт завершён!", reply_markup=InlineKeyboardMarkup(keyboard))
     
     # Отправить Zoom-ссылку
     elif action == 'admin_sendlink':
-        dates = get_dates_with_counts()
+        dates = await asyncio.to_thread(get_dates_with_counts)
         
         if not dates:
             text = "📅 Нет зарегистрированных участников."
@@ -208,10 +232,10 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         date = action.replace('admin_sendlink_', '')
         context.user_data['sendlink_date'] = date
         
-        participants = get_participants_by_date(date)
+        count = await asyncio.to_thread(count_participants, {'zoom_date': date})
         text = (
             f"🔗 **Рассылка Zoom-ссылки на {date}**\n\n"
-            f"Получателей: {len(participants)}\n\n"
+            f"Получателей: {count}\n\n"
             "Отправьте мне Zoom-ссылку и текст сообщения (можно в несколько строк).\n"
             "Пример:\n"
             "```\n"
@@ -259,26 +283,27 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
         category = action.replace('broadcast_', '')
         context.user_data['broadcast_category'] = category
         
-        # Подсчитываем получателей
+        # Запоминаем фильтры (не список ID), получатели выбираются при отправке
         if category == 'all':
-            ids = get_telegram_ids_by_category()
+            filters = {}
             cat_text = "всем участникам"
         elif category == 'activated':
-            ids = get_telegram_ids_by_category(only_activated=True)
+            filters = {'is_activated': True}
             cat_text = "активированным участникам"
         elif category in ['ru', 'en', 'he']:
-            ids = get_telegram_ids_by_category(language=category)
+            filters = {'language': category}
             lang_names = {'ru': 'русскоязычным', 'en': 'англоязычным', 'he': 'ивритоязычным'}
             cat_text = lang_names[category]
         else:
-            ids = []
+            filters = None
             cat_text = "неизвестной категории"
         
-        context.user_data['broadcast_ids'] = ids
+        context.user_data['broadcast_filters'] = filters
+        count = await asyncio.to_thread(count_participants, filters) if filters is not None else 0
         
         text = (
             f"📢 **Рассылка {cat_text}**\n\n"
-            f"Получателей: {len(ids)}\n\n"
+            f"Получателей: {count}\n\n"
             "Отправьте мне текст сообщения для рассылки.\n\n"
             "Или /cancel для отмены."
         )
@@ -317,15 +342,15 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
         date = context.user_data.get('sendlink_date')
         message_text = update.message.text
         
-        participants = get_participants_by_date(date)
-        telegram_ids = [p['telegram_id'] for p in participants]
+        filters = {'zoom_date': date}
+        count = await asyncio.to_thread(count_participants, filters)
         
-        await update.message.reply_text(f"📤 Отправляю {len(telegram_ids)} сообщений...")
+        await update.message.reply_text(f"📤 Отправляю {count} сообщений...")
         
         success = 0
         failed = 0
         
-        for tid in telegram_ids:
+        async for tid in iter_recipient_ids(filters):
             try:
                 await context.bot.send_message(chat_id=tid, text=message_text)
                 success += 1
@@ -365,32 +390,42 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
         
         await update.message.reply_text(f"⏳ Активирую {len(valid_codes)} кодов...")
         
-        success, failed = activate_participants_bulk(valid_codes)
+        report = await asyncio.to_thread(activate_participants_bulk, valid_codes)
         
-        await update.message.reply_text(
+        text = (
             f"✅ **Активация завершена!**\n\n"
-            f"Успешно активировано: {success}\n"
-            f"Не найдено/ошибок: {failed}",
-            parse_mode='Markdown'
+            f"Успешно активировано: {len(report['activated'])}\n"
+            f"Уже были активированы: {len(report['already_active'])}\n"
+            f"Не найдено: {len(report['unknown'])}"
         )
         
+        # Список ненайденных кодов (с ограничением длины сообщения)
+        if report['unknown']:
+            shown = report['unknown'][:MAX_CODES_IN_REPLY]
+            text += "\n\n**Ненайденные коды:**\n```\n" + "\n".join(shown) + "\n```"
+            if len(report['unknown']) > len(shown):
+                text += f"\n…и ещё {len(report['unknown']) - len(shown)}"
+        
+        await update.message.reply_text(text, parse_mode='Markdown')
+        
         context.user_data['awaiting_codes'] = False
     
     # Рассылка сообщения
     elif context.user_data.get('awaiting_broadcast'):
         message_text = update.message.text
-        telegram_ids = context.user_data.get('broadcast_ids', [])
+        filters = context.user_data.get('broadcast_filters')
+        count = await asyncio.to_thread(count_participants, filters) if filters is not None else 0
         
-        if not telegram_ids:
+        if not count:
             await update.message.reply_text("❌ Список получателей пуст.")
             return
         
-        await update.message.reply_text(f"📤 Отправляю {len(telegram_ids)} сообщений...")
+        await update.message.reply_text(f"📤 Отправляю {count} сообщений...")
         
         success = 0
         failed = 0
         
-        for tid in telegram_ids:
+        async for tid in iter_recipient_ids(filters):
             try:
                 await context.bot.send_message(chat_id=tid, text=message_text)
                 success += 1
@@ -407,9 +442,4 @@ async def admin_message_handler(update: Update, context: ContextTypes.DEFAULT_TY
         
         context.user_data['awaiting_broadcast'] = False
         context.user_data['broadcast_category'] = None
-        context.user_data['broadcast_ids'] = None
-
-
-# Импортируем datetime для экспорта
-from datetime import datetime
-
+        context.user_data['broadcast_filters'] = None
@@ -4,180 +4,539 @@
 """
 
 import os
+import asyncio
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Callable, Dict, Any, Iterable, List, Iterator, Sequence, Tuple
 import random
 
+from db_metrics import instrument, metrics as query_metrics
+from participant_cache import ParticipantCache
+import queries as sql
+from queries import Query
+
+logger = logging.getLogger(__name__)
+
 # Определяем тип БД
 DATABASE_URL = os.getenv("DATABASE_URL")  # PostgreSQL на Render
 USE_POSTGRES = DATABASE_URL is not None
 
 if USE_POSTGRES:
-    import psycopg
-    from psycopg.rows import dict_row
+    from psycopg.rows import dict_row, tuple_row
+    from psycopg_pool import ConnectionPool, PoolTimeout
     # Render использует postgres://, но psycopg требует postgresql://
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Настройки пула соединений PostgreSQL
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # секунды ожидания свободного соединения
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # закрывать простаивающие соединения
+
+# Подготовленные операторы PostgreSQL (выключить, если перед БД стоит PgBouncer в режиме transaction)
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+# После скольких выполнений одного запроса на соединении psycopg готовит его сам
+PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+
+# Таймаут ожидания блокировки SQLite (секунды)
+SQLITE_TIMEOUT = float(os.getenv("SQLITE_TIMEOUT", "5"))
+# Размер отображения файла SQLite в память (байты, 0 — выключено)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Кэш разобранных операторов на соединение SQLite
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+
+# ID участников начинаются с 12000
+FIRST_PARTICIPANT_ID = 12000
+# Сколько ID процесс резервирует за раз (hi-lo). 1 = ID выдаётся прямо в INSERT
+PARTICIPANT_ID_BLOCK_SIZE = int(os.getenv("PARTICIPANT_ID_BLOCK_SIZE", "1"))
+
+# Сколько строк импортировать одной транзакцией (bulk_import_participants)
+IMPORT_CHUNK_SIZE = int(os.getenv("DB_IMPORT_CHUNK_SIZE", "5000"))
+# telegram_id в файле импорта: только целое число (отрицательные — ID email-участников)
+TELEGRAM_ID_PATTERN = re.compile(r'-?[0-9]+')
+
+# Сколько строк за раз читать при потоковой выборке (экспорт, рассылки)
+STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))
+
+# Кэш строк участников: размер и время жизни записи (секунды)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Вместимость Zoom-встречи по умолчанию (для конкретной даты меняется через set_date_capacity)
+DEFAULT_DATE_CAPACITY = int(os.getenv("MAX_PARTICIPANTS_PER_DATE", "290"))
+
+# Пространство 6-значных кодов активации
+ACTIVATION_CODE_MIN = 100000
+ACTIVATION_CODE_MAX = 999999
+
+# Колонки таблицы participants (в порядке SELECT *)
+PARTICIPANT_COLUMNS = (
+    'id', 'telegram_id', 'username', 'first_name', 'email', 'participant_type',
+    'participant_id', 'activation_code', 'zoom_date', 'registration_date',
+    'language', 'is_activated', 'activation_date',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def participant_row_type(columns: Tuple[str, ...]):
+    """Тип строки участника для набора колонок (namedtuple, создаётся один раз на набор)"""
+    return namedtuple('Participant', columns)
+
+
+# Строка участника со всеми колонками: компактнее dict, поля доступны как атрибуты
+Participant = participant_row_type(PARTICIPANT_COLUMNS)
+
+# Фильтры выборки участников: имя -> условие SQL
+PARTICIPANT_FILTERS = {
+    'language': "language = %s",
+    'participant_type': "participant_type = %s",
+    'date_from': "registration_date >= %s",
+    'date_to': "registration_date <= %s",
+    'zoom_date': "zoom_date = %s",
+    'is_activated': "COALESCE(is_activated, FALSE) = %s",
+}
+
+
+class PoolMetrics:
+    """Метрики получения соединений из пула"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+    
+    def record_acquire(self, wait_ms: float):
+        with self._lock:
+            self.acquired += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+    
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'acquired': self.acquired,
+                'acquire_timeouts': self.timeouts,
+                'acquire_wait_ms_avg': self.wait_ms_total / self.acquired if self.acquired else 0.0,
+                'acquire_wait_ms_max': self.wait_ms_max,
+            }
+
+
+# Общий пул на процесс: Telegram-бот, админка и email-бот используют одни соединения
+_pool = None
+_pool_lock = threading.Lock()
+_pool_metrics = PoolMetrics()
 
+# SQLite: одно постоянное соединение на поток (и на файл БД)
+_sqlite_local = threading.local()
+
+# SQLite: поток-писатель на каждый файл БД
+_sqlite_writers: Dict[str, "SQLiteWriter"] = {}
+_sqlite_writers_lock = threading.Lock()
+
+# Общий на процесс кэш участников (Telegram-бот, админка и email-бот)
+_user_cache = ParticipantCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Имена серверных курсоров PostgreSQL
+_cursor_names = itertools.count()
+
+# Зарезервированный процессом блок ID участников (hi-lo)
+_id_block: List[int] = []
+_id_block_lock = threading.Lock()
+
+# Подписчики на изменение мест по датам (кэш выбора даты)
+_seats_listeners: List[Callable[[], None]] = []
+
+
+def get_pool():
+    """Получить (и при необходимости создать) общий пул соединений PostgreSQL"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_idle=POOL_MAX_IDLE,
+                    kwargs={
+                        'row_factory': dict_row,
+                        'prepare_threshold': PREPARE_THRESHOLD if PREPARED_STATEMENTS else None,
+                    },
+                    check=ConnectionPool.check_connection,  # проверка соединения перед выдачей
+                    name='summit-db',
+                    open=False,
+                )
+                _pool.open()
+    return _pool
+
+
+def close_pool():
+    """Закрыть общий пул соединений (при остановке процесса)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_sqlite_connection(db_path: str) -> sqlite3.Connection:
+    """Постоянное соединение SQLite для текущего потока"""
+    connections = getattr(_sqlite_local, 'connections', None)
+    if connections is None:
+        connections = _sqlite_local.connections = {}
+    
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=SQLITE_TIMEOUT, cached_statements=SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        # WAL: чтения не блокируются записью и идут параллельно с ней
+        conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL fsync при каждом commit не нужен для целостности файла
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_TIMEOUT * 1000)}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        connections[db_path] = conn
+        _pool_metrics.record_acquire(0.0)
+    return conn
+
+
+class SQLiteWriter:
+    """
+    Единственный поток записи в файл SQLite.
+    Записи из всех потоков (Telegram-бот, email-бот, админка) выполняются
+    по очереди на одном соединении, поэтому не конкурируют за блокировку
+    и не получают "database is locked". Чтения идут параллельно (WAL).
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+    
+    def submit(self, func, *args):
+        """Выполнить func(conn, *args) в потоке-писателе одной транзакцией и вернуть результат"""
+        if threading.current_thread() is self._thread:
+            # Вложенная запись — в уже открытой транзакции
+            return func(get_sqlite_connection(self.db_path), *args)
+        
+        future = Future()
+        self._queue.put((future, func, args))
+        return future.result()
+    
+    def stop(self):
+        """Дождаться выполнения очереди и остановить поток"""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        conn = get_sqlite_connection(self.db_path)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            future, func, args = item
+            try:
+                result = func(conn, *args)
+                conn.commit()
+            except BaseException as e:
+                conn.rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        
+        getattr(_sqlite_local, 'connections', {}).pop(self.db_path, None)
+        conn.close()
+
+
+def get_sqlite_writer(db_path: str) -> SQLiteWriter:
+    """Поток-писатель для файла SQLite (создаётся при первой записи)"""
+    writer = _sqlite_writers.get(db_path)
+    if writer is None:
+        with _sqlite_writers_lock:
+            writer = _sqlite_writers.get(db_path)
+            if writer is None:
+                writer = _sqlite_writers[db_path] = SQLiteWriter(db_path)
+    return writer
+
+
+def stop_sqlite_writer(db_path: str):
+    """Остановить поток-писатель файла SQLite (при остановке процесса)"""
+    with _sqlite_writers_lock:
+        writer = _sqlite_writers.pop(db_path, None)
+    if writer is not None:
+        writer.stop()
+
+
+def add_seats_listener(callback: Callable[[], None]):
+    """Вызывать callback() после каждого изменения записанных или вместимости дат (после commit)"""
+    _seats_listeners.append(callback)
+
+
+def _notify_seats_changed():
+    for callback in _seats_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Seats listener failed: {e}")
+
+
+def email_to_telegram_id(email_address: str) -> int:
+    """Генерирует уникальный отрицательный telegram_id из email"""
+    hash_object = hashlib.sha256(email_address.lower().encode())
+    hex_dig = hash_object.hexdigest()
+    return -int(hex_dig[:15], 16)
+
+
+def participant_fingerprint(row: Sequence[Any]) -> bytes:
+    """Каноническое представление строки участника для контрольной суммы (не зависит от БД)"""
+    return '\x1f'.join(
+        '' if value is None
+        else value.isoformat() if hasattr(value, 'isoformat')
+        else str(value)
+        for value in row
+    ).encode()
+
+
+def checksum_rows(rows: Iterable[Sequence[Any]]) -> Tuple[int, str]:
+    """(число строк, sha256) для строк участников в порядке id"""
+    digest = hashlib.sha256()
+    count = 0
+    for row in rows:
+        digest.update(participant_fingerprint(row))
+        digest.update(b'\n')
+        count += 1
+    return count, digest.hexdigest()
+
+
+# Время каждого публичного метода пишется в метрики (db_metrics)
+@instrument(
+    include=('_read_user',),
+    exclude=('connection', 'close', 'cache_stats', 'pool_stats', 'query_stats', 'prometheus_metrics')
+)
 class Database:
     """Класс для работы с базой данных участников"""
     
     def __init__(self, db_path: str = "summit_bot.db"):
         self.db_path = db_path
         self.use_postgres = USE_POSTGRES
+        self.backend = 'postgres' if self.use_postgres else 'sqlite'
         self.init_database()
     
-    def get_connection(self):
-        """Получить подключение к БД"""
+    @contextmanager
+    def connection(self):
+        """
+        Соединение из пула (PostgreSQL) или постоянное соединение потока (SQLite).
+        При выходе из блока — commit, при исключении — rollback.
+        """
+        if self.use_postgres:
+            pool = get_pool()
+            start = time.perf_counter()
+            try:
+                conn = pool.getconn(timeout=POOL_TIMEOUT)
+            except PoolTimeout:
+                _pool_metrics.record_timeout()
+                raise
+            _pool_metrics.record_acquire((time.perf_counter() - start) * 1000)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                pool.putconn(conn)
+        else:
+            conn = get_sqlite_connection(self.db_path)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    
+    def _write(self, func, *args):
+        """
+        Выполнить запись func(conn, *args) одной транзакцией: в SQLite — в потоке-писателе,
+        в PostgreSQL — на соединении из пула. Возвращает результат func.
+        """
         if self.use_postgres:
-            return psycopg.connect(DATABASE_URL, row_factory=dict_row)
+            with self.connection() as conn:
+                return func(conn, *args)
+        return get_sqlite_writer(self.db_path).submit(func, *args)
+    
+    def _run(self, cursor, query: Query, params: tuple = ()):
+        """Выполнить запрос из queries в диалекте текущей БД (частые — как подготовленные)"""
+        if self.use_postgres:
+            if query.prepare and PREPARED_STATEMENTS:
+                cursor.execute(query.postgres, params, prepare=True)
+            else:
+                # Без prepare: так же работает и с серверным (именованным) курсором
+                cursor.execute(query.postgres, params)
         else:
-            return sqlite3.connect(self.db_path)
+            cursor.execute(query.sqlite, params)
+        return cursor
+    
+    def _execute(self, conn, query: Query, params: tuple = ()):
+        """Один запрос на запись (для _write)"""
+        self._run(conn.cursor(), query, params)
+    
+    def _array(self, values: Iterable) -> Any:
+        """Список значений как один параметр запроса (массив в PostgreSQL, JSON в SQLite)"""
+        return list(values) if self.use_postgres else json.dumps(list(values))
+    
+    def _ts(self, value: datetime):
+        """Дата-время как параметр запроса (SQLite хранит ISO-строку)"""
+        return value if self.use_postgres else value.isoformat()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша участников (попадания, промахи, размер)"""
+        return _user_cache.stats()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Метрики пула соединений (для мониторинга)"""
+        stats = _pool_metrics.snapshot()
+        stats['backend'] = self.backend
+        if self.use_postgres:
+            stats.update(get_pool().get_stats())
+        return stats
+    
+    def query_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Число вызовов и задержки по методам: {'метод[БД]': {count, avg_ms, p95_ms, ...}}"""
+        return query_metrics.stats()
+    
+    def prometheus_metrics(self) -> str:
+        """Метрики вызовов БД в текстовом формате Prometheus"""
+        return query_metrics.prometheus_text()
+    
+    def close(self):
+        """Закрыть соединения с БД"""
+        if self.use_postgres:
+            close_pool()
+        else:
+            stop_sqlite_writer(self.db_path)
+            conn = getattr(_sqlite_local, 'connections', {}).pop(self.db_path, None)
+            if conn is not None:
+                conn.close()
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
-        conn = self.get_connection()
+        """Инициализация базы данных: применить недостающие миграции схемы"""
+        from migrations import migrate
+        migrate(self)
+    
+    def _fill_activation_code_pool(self, cursor):
+        """
+        Заполнить пул кодов активации (один раз, пока пул пуст):
+        все ещё не выданные коды 100000-999999 в перемешанном порядке
+        """
+        if self._run(cursor, sql.ACTIVATION_CODE_POOL_FILLED).fetchone()['filled']:
+            return
         
         if self.use_postgres:
-            cursor = conn.cursor()
+            self._run(cursor, sql.FILL_ACTIVATION_CODE_POOL, (ACTIVATION_CODE_MIN, ACTIVATION_CODE_MAX))
         else:
-            cursor = conn.cursor()
-        
-        # Таблица участников
+            used = {row['activation_code'] for row in self._run(cursor, sql.SELECT_USED_ACTIVATION_CODES).fetchall()}
+            codes = [
+                str(c) for c in range(ACTIVATION_CODE_MIN, ACTIVATION_CODE_MAX + 1)
+                if str(c) not in used
+            ]
+            random.SystemRandom().shuffle(codes)
+            cursor.executemany(sql.INSERT_ACTIVATION_CODE.sqlite, enumerate(codes, start=1))
+    
+    def _compact_activation_code_pool(self, cursor):
+        """
+        PostgreSQL: перенумеровать пул подряд с 1 (если в нём есть пропуски)
+        и поставить последовательность позиций на начало
+        """
+        bounds = self._run(cursor, sql.ACTIVATION_CODE_POOL_BOUNDS).fetchone()
+        if bounds['total'] and (bounds['first'] != 1 or bounds['last'] != bounds['total']):
+            self._run(cursor, sql.RENUMBER_ACTIVATION_CODE_POOL)
+            self._run(cursor, sql.RESTORE_ACTIVATION_CODE_POSITIONS)
+        self._run(cursor, sql.RESET_ACTIVATION_CODE_POSITION, (1,))
+    
+    def reserve_participant_ids(self, count: int) -> List[int]:
+        """Зарезервировать блок из count уникальных ID участников за один запрос"""
+        return self._write(self._reserve_participant_ids, count)
+    
+    def _reserve_participant_ids(self, conn, count: int) -> List[int]:
+        cursor = conn.cursor()
         if self.use_postgres:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS participants (
-                    id SERIAL PRIMARY KEY,
-                    telegram_id BIGINT UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    email TEXT,
-                    participant_type TEXT,
-                    participant_id INTEGER UNIQUE,
-                    activation_code VARCHAR(6) UNIQUE,
-                    zoom_date DATE,
-                    registration_date TIMESTAMP,
-                    language TEXT DEFAULT 'ru',
-                    is_activated BOOLEAN DEFAULT FALSE,
-                    activation_date TIMESTAMP
-                )
-            """)
-            
-            # Добавляем поле email если его нет (миграция)
-            try:
-                cursor.execute("""
-                    ALTER TABLE participants 
-                    ADD COLUMN IF NOT EXISTS email TEXT
-                """)
-                conn.commit()
-            except Exception:
-                pass  # Поле уже существует
+            self._run(cursor, sql.RESERVE_PARTICIPANT_IDS, (count,))
+            return [row['id'] for row in cursor.fetchall()]
         else:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS participants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    email TEXT,
-                    participant_type TEXT,
-                    participant_id INTEGER UNIQUE,
-                    activation_code TEXT UNIQUE,
-                    zoom_date TEXT,
-                    registration_date TEXT,
-                    language TEXT DEFAULT 'ru',
-                    is_activated INTEGER DEFAULT 0,
-                    activation_date TEXT
-                )
-            """)
-            
-            # Добавляем поле email если его нет (миграция)
-            try:
-                cursor.execute("ALTER TABLE participants ADD COLUMN email TEXT")
-                conn.commit()
-            except Exception:
-                pass  # Поле уже существует
-        
-        conn.commit()
-        conn.close()
+            last_id = self._advance_id_counter(cursor, count)
+            return list(range(last_id - count + 1, last_id + 1))
+    
+    def _advance_id_counter(self, cursor, count: int = 1) -> int:
+        """SQLite: сдвинуть счётчик ID внутри текущей транзакции, вернуть последний выданный ID"""
+        return self._run(cursor, sql.ADVANCE_ID_COUNTER, (count,)).fetchone()['value']
+    
+    def _take_reserved_participant_id(self) -> Optional[int]:
+        """ID из блока, зарезервированного процессом (None, если hi-lo выключен)"""
+        if PARTICIPANT_ID_BLOCK_SIZE <= 1:
+            return None
+        with _id_block_lock:
+            if not _id_block:
+                _id_block.extend(reversed(self.reserve_participant_ids(PARTICIPANT_ID_BLOCK_SIZE)))
+            return _id_block.pop()
     
     def generate_participant_id(self) -> int:
         """Генерация уникального ID участника (начиная с 12000)"""
-        if self.use_postgres:
-            # Для MAX используем обычный курсор без dict_row
-            import psycopg
-            conn = psycopg.connect(DATABASE_URL)
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(participant_id) FROM participants")
-            result = cursor.fetchone()
-            conn.close()
-            last_id = result[0] if result and result[0] is not None else 11999
-        else:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(participant_id) FROM participants")
-            result = cursor.fetchone()
-            conn.close()
-            last_id = result[0] if result and result[0] is not None else 11999
-        
-        return last_id + 1
+        participant_id = self._take_reserved_participant_id()
+        if participant_id is None:
+            participant_id = self.reserve_participant_ids(1)[0]
+        return participant_id
     
     def generate_activation_code(self) -> str:
-        """Генерация уникального 6-значного кода активации"""
-        while True:
-            code = str(random.randint(100000, 999999))
-            
-            # Проверяем уникальность
-            if self.use_postgres:
-                # Для COUNT используем обычный курсор без dict_row
-                import psycopg
-                conn = psycopg.connect(DATABASE_URL)
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT COUNT(*) FROM participants WHERE activation_code = %s",
-                    (code,)
-                )
-                count = cursor.fetchone()[0]
-                conn.close()
-            else:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT COUNT(*) FROM participants WHERE activation_code = ?",
-                    (code,)
-                )
-                count = cursor.fetchone()[0]
-                conn.close()
-            
-            if count == 0:
-                return code
+        """Выдать уникальный 6-значный код активации из пула (O(1), без повторных попыток)"""
+        row = self._write(self._take_activation_code)
+        if not row:
+            raise RuntimeError("Пул кодов активации исчерпан")
+        return row['code']
+    
+    def _take_activation_code(self, conn) -> Optional[Dict[str, Any]]:
+        row = self._run(conn.cursor(), sql.TAKE_ACTIVATION_CODE).fetchone()
+        return dict(row) if row else None
     
     def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
-        """Получить информацию о пользователе по Telegram ID"""
-        conn = self.get_connection()
-        
-        if self.use_postgres:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE telegram_id = %s",
-                (telegram_id,)
-            )
-            row = cursor.fetchone()
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE telegram_id = ?",
-                (telegram_id,)
-            )
-            row = cursor.fetchone()
-        
-        conn.close()
+        """Получить информацию о пользователе по Telegram ID (через кэш)"""
+        cached = _user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        return self._read_user(telegram_id)
+    
+    def _read_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Прочитать участника из БД и положить в кэш"""
+        generation = _user_cache.generation()
+        with self.connection() as conn:
+            row = self._run(conn.cursor(), sql.SELECT_USER, (telegram_id,)).fetchone()
         
         if row:
-            return dict(row)
+            user = dict(row)
+            _user_cache.put(user, generation)
+            return dict(user)
         return None
     
     def create_user(
@@ -189,162 +548,491 @@ class Database:
         language: str = 'ru'
     ) -> tuple[int, str]:
         """Создать нового пользователя и вернуть (ID, код активации)"""
-        conn = self.get_connection()
+        row = self.register_participant(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            participant_type=participant_type,
+            language=language
+        )
+        return row['participant_id'], row['activation_code']
+    
+    def register_participant(
+        self,
+        telegram_id: int,
+        username: str,
+        first_name: str,
+        participant_type: str,
+        language: str = 'ru',
+        zoom_date: Optional[str] = None,
+        email: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Зарегистрировать участника одной транзакцией: ID, код активации, дата и email
+        записываются сразу, возвращается полная строка участника.
+        Если на zoom_date нет мест — ничего не создаётся, возвращается None.
+        """
+        # ID и код выдаются атомарно внутри транзакции INSERT (ID — или из блока hi-lo)
+        participant_id = self._take_reserved_participant_id()
+        registration_date = datetime.now()
+        
+        register = self._register_postgres if self.use_postgres else self._register_sqlite
+        row = self._write(
+            register, telegram_id, username, first_name, email, participant_type,
+            participant_id, zoom_date, self._ts(registration_date), language
+        )
+        
+        if row is None:
+            if zoom_date is None:
+                raise RuntimeError("Пул кодов активации исчерпан")
+            return None
+        
+        participant = dict(row)
+        _user_cache.invalidate(telegram_id)
+        _user_cache.put(participant)
+        if zoom_date is not None:
+            _notify_seats_changed()
+        return dict(participant)
+    
+    def _register_postgres(self, conn, telegram_id, username, first_name, email, participant_type,
+                           participant_id, zoom_date, registration_date, language):
+        """PostgreSQL: место на дату, код и строка участника — одним запросом"""
+        params = (telegram_id, username, first_name, email, participant_type,
+                  participant_id, registration_date, language)
+        if zoom_date is None:
+            cursor = self._run(conn.cursor(), sql.REGISTER_WITHOUT_DATE, params)
+        else:
+            cursor = self._run(conn.cursor(), sql.REGISTER_WITH_DATE, (zoom_date, DEFAULT_DATE_CAPACITY) + params)
+        row = cursor.fetchone()
+        if row is None:
+            # Мест нет (позиция пула не тронута) или пул пуст (позиция пройдена): откат
+            conn.rollback()
+            return None
+        self._add_stats(cursor, {self._stats_group(row): 1})
+        return dict(row)
+    
+    def _register_sqlite(self, conn, telegram_id, username, first_name, email, participant_type,
+                         participant_id, zoom_date, registration_date, language):
+        """SQLite: те же шаги последовательно внутри одной транзакции с блокировкой на запись"""
         cursor = conn.cursor()
+        self._lock_for_write(cursor)
         
-        participant_id = self.generate_participant_id()
-        activation_code = self.generate_activation_code()
-        registration_date = datetime.now()
+        if zoom_date is not None:
+            if not self._run(cursor, sql.BOOK_SEAT_IF_FREE, (zoom_date, DEFAULT_DATE_CAPACITY)).fetchone():
+                conn.rollback()
+                return None
         
-        if self.use_postgres:
-            cursor.execute("""
-                INSERT INTO participants 
-                (telegram_id, username, first_name, participant_type, 
-                 participant_id, activation_code, registration_date, language)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (telegram_id, username, first_name, participant_type,
-                  participant_id, activation_code, registration_date, language))
+        if participant_id is None:
+            participant_id = self._advance_id_counter(cursor)
+        
+        code = self._run(cursor, sql.TAKE_ACTIVATION_CODE).fetchone()
+        if not code:
+            conn.rollback()
+            return None
+        
+        self._run(cursor, sql.INSERT_PARTICIPANT, (
+            telegram_id, username, first_name, email, participant_type,
+            participant_id, code['code'], zoom_date, registration_date, language
+        ))
+        row = dict(cursor.fetchone())
+        self._add_stats(cursor, {self._stats_group(row): 1})
+        return row
+    
+    def bulk_import_participants(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        chunk_size: int = IMPORT_CHUNK_SIZE
+    ) -> Dict[str, int]:
+        """
+        Массовый импорт участников (регистрации с сайта) пачками по chunk_size строк,
+        каждая пачка — одной транзакцией. ID и коды активации выдаются сразу на пачку,
+        в PostgreSQL строки загружаются через COPY, в SQLite — executemany.
+        Строка: telegram_id и/или email, username, first_name, participant_type,
+        language, zoom_date, registration_date.
+        Уже зарегистрированные (по telegram_id или email без учёта регистра) пропускаются,
+        места на датах не проверяются. Строки без telegram_id и email или с нецелым
+        telegram_id считаются ошибочными (invalid).
+        Возвращает {'imported': ..., 'skipped': ..., 'invalid': ...}
+        """
+        report = {'imported': 0, 'skipped': 0, 'invalid': 0}
+        registration_date = self._ts(datetime.now())
+        rows = iter(rows)
+        
+        while True:
+            raw_chunk = list(itertools.islice(rows, chunk_size))
+            if not raw_chunk:
+                break
+            
+            chunk = []
+            for row in raw_chunk:
+                participant = self._import_row(row, registration_date)
+                if participant is None:
+                    report['invalid'] += 1
+                else:
+                    chunk.append(participant)
+            if not chunk:
+                continue
+            
+            imported = self._write(self._import_chunk, chunk)
+            _user_cache.invalidate(*imported)
+            if imported:
+                _notify_seats_changed()
+            report['imported'] += len(imported)
+            report['skipped'] += len(chunk) - len(imported)
+        
+        return report
+    
+    def _import_row(self, row: Dict[str, Any], registration_date) -> Optional[Dict[str, Any]]:
+        """
+        Привести строку импорта к колонкам participants
+        (None — нет ни telegram_id, ни email, или telegram_id не целое число)
+        """
+        def value(name):
+            raw = row.get(name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            return raw if raw not in ('', None) else None
+        
+        email = value('email')
+        telegram_id = value('telegram_id')
+        if telegram_id is not None:
+            # Только целые: '123.0', '1e5', '1_000' и 123.0 — ошибка в выгрузке, а не ID
+            if isinstance(telegram_id, str) and TELEGRAM_ID_PATTERN.fullmatch(telegram_id):
+                telegram_id = int(telegram_id)
+            elif not isinstance(telegram_id, int) or isinstance(telegram_id, bool):
+                return None
+        elif email:
+            telegram_id = email_to_telegram_id(email)
         else:
-            cursor.execute("""
-                INSERT INTO participants 
-                (telegram_id, username, first_name, participant_type, 
-                 participant_id, activation_code, registration_date, language)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (telegram_id, username, first_name, participant_type,
-                  participant_id, activation_code, registration_date.isoformat(), language))
-        
-        conn.commit()
-        conn.close()
+            return None
         
-        return participant_id, activation_code
+        return {
+            'telegram_id': telegram_id,
+            'username': value('username'),
+            'first_name': value('first_name'),
+            'email': email,
+            'participant_type': value('participant_type') or 'participant',
+            'zoom_date': value('zoom_date'),
+            'registration_date': value('registration_date') or registration_date,
+            'language': value('language') or 'ru',
+        }
     
-    def update_zoom_date(self, telegram_id: int, zoom_date: str):
-        """Обновить дату Zoom-встречи"""
-        conn = self.get_connection()
+    def _import_chunk(self, conn, rows: List[Dict[str, Any]]) -> List[int]:
+        """Вставить пачку новых участников, вернуть их telegram_id"""
         cursor = conn.cursor()
+        self._lock_for_write(cursor)
+        
+        # Повторы внутри пачки и уже зарегистрированные (тот же telegram_id или email
+        # без учёта регистра) пропускаются
+        by_id = {}
+        emails = set()
+        for row in rows:
+            email = row['email'].lower() if row['email'] else None
+            if row['telegram_id'] in by_id or email in emails:
+                continue
+            by_id[row['telegram_id']] = row
+            if email:
+                emails.add(email)
+        
+        existing_ids = {
+            row['telegram_id']
+            for row in self._run(cursor, sql.SELECT_EXISTING_TELEGRAM_IDS, (self._array(by_id),)).fetchall()
+        }
+        existing_emails = {
+            row['email']
+            for row in self._run(cursor, sql.SELECT_EXISTING_EMAILS, (self._array(emails),)).fetchall()
+        } if emails else set()
+        new_rows = [
+            row for telegram_id, row in by_id.items()
+            if telegram_id not in existing_ids
+            and not (row['email'] and row['email'].lower() in existing_emails)
+        ]
+        if not new_rows:
+            return []
+        
+        participant_ids = self._reserve_participant_ids(conn, len(new_rows))
+        codes = [row['code'] for row in self._run(cursor, sql.TAKE_ACTIVATION_CODES, (len(new_rows),)).fetchall()]
+        if len(codes) < len(new_rows):
+            raise RuntimeError("Пул кодов активации исчерпан")
+        
+        values = [
+            (row['telegram_id'], row['username'], row['first_name'], row['email'], row['participant_type'],
+             participant_id, code, row['zoom_date'], row['registration_date'], row['language'])
+            for row, participant_id, code in zip(new_rows, participant_ids, codes)
+        ]
         
         if self.use_postgres:
-            cursor.execute(
-                "UPDATE participants SET zoom_date = %s WHERE telegram_id = %s",
-                (zoom_date, telegram_id)
-            )
+            self._run(cursor, sql.CREATE_IMPORT_STAGING)
+            with cursor.copy(sql.COPY_IMPORT_STAGING.postgres) as copy:
+                for row in values:
+                    copy.write_row(row)
+            inserted = [dict(row) for row in self._run(cursor, sql.INSERT_FROM_IMPORT_STAGING).fetchall()]
         else:
-            cursor.execute(
-                "UPDATE participants SET zoom_date = ? WHERE telegram_id = ?",
-                (zoom_date, telegram_id)
-            )
+            cursor.executemany(sql.IMPORT_PARTICIPANT.sqlite, values)
+            inserted = new_rows
         
-        conn.commit()
-        conn.close()
+        # Счётчики мест на датах и статистики — одним запросом на дату / группу
+        booked = {}
+        stats = {}
+        for row in inserted:
+            if row['zoom_date'] is not None:
+                booked[row['zoom_date']] = booked.get(row['zoom_date'], 0) + 1
+            group = self._stats_group(row, is_activated=False)
+            stats[group] = stats.get(group, 0) + 1
+        for zoom_date, count in sorted(booked.items()):
+            self._run(cursor, sql.ADD_BOOKED, (zoom_date, DEFAULT_DATE_CAPACITY, count))
+        self._add_stats(cursor, stats)
+        
+        return [row['telegram_id'] for row in inserted]
     
-    def update_user_email(self, telegram_id: int, email: str):
-        """Обновить email пользователя"""
-        conn = self.get_connection()
+    def load_participants(
+        self,
+        rows: Iterable[Sequence[Any]],
+        expected: Optional[Tuple[int, str]] = None
+    ) -> int:
+        """
+        PostgreSQL: загрузить строки участников (все колонки PARTICIPANT_COLUMNS, с id)
+        через COPY одной транзакцией, затем сдвинуть последовательности, убрать выданные
+        коды из пула (с перенумерацией) и пересчитать места на датах и статистику. Если передан expected = (число строк,
+        контрольная сумма), они сверяются до commit; при расхождении всё откатывается.
+        Возвращает число загруженных строк.
+        """
+        if not self.use_postgres:
+            raise RuntimeError("Загрузка через COPY доступна только для PostgreSQL")
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            count = 0
+            with cursor.copy(sql.COPY_PARTICIPANTS.postgres) as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    count += 1
+            
+            if count:
+                self._run(cursor, sql.SYNC_ROW_ID_SEQUENCE)
+                self._run(cursor, sql.SYNC_PARTICIPANT_ID_SEQUENCE, (FIRST_PARTICIPANT_ID,))
+            self._run(cursor, sql.DROP_USED_ACTIVATION_CODES)
+            self._compact_activation_code_pool(cursor)
+            self._reconcile_date_capacity(cursor)
+            self._reconcile_registration_stats(cursor)
+            
+            if expected is not None:
+                actual = self._participants_checksum(conn)
+                if actual != tuple(expected):
+                    raise RuntimeError(
+                        f"Проверка не пройдена: ожидалось {expected[0]} строк ({expected[1]}), "
+                        f"загружено {actual[0]} ({actual[1]})"
+                    )
+        
+        _user_cache.clear()
+        _notify_seats_changed()
+        return count
+    
+    def participants_checksum(self) -> Tuple[int, str]:
+        """(число участников, sha256 по всем колонкам в порядке id) — для сверки после переноса"""
+        with self.connection() as conn:
+            return self._participants_checksum(conn)
+    
+    def _participants_checksum(self, conn) -> Tuple[int, str]:
+        name = f"stream_{next(_cursor_names)}" if self.use_postgres else None
+        cursor = self._tuple_cursor(conn, name)
+        try:
+            self._run(cursor, sql.SELECT_PARTICIPANTS_BY_ID)
+            
+            def rows():
+                while True:
+                    batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+                    if not batch:
+                        return
+                    yield from batch
+            
+            return checksum_rows(rows())
+        finally:
+            cursor.close()
+    
+    def update_zoom_date(self, telegram_id: int, zoom_date: str):
+        """Обновить дату Zoom-встречи (без проверки лимита; счётчики дат обновляются в той же транзакции)"""
+        if self._write(self._move_booking, telegram_id, zoom_date, False):
+            _notify_seats_changed()
+        _user_cache.invalidate(telegram_id)
+    
+    def reserve_seat(self, telegram_id: int, zoom_date: str) -> bool:
+        """
+        Атомарно записать участника на дату, если на ней есть места.
+        Возвращает True при успехе, False если мест нет (или участник не найден).
+        """
+        reserved = self._write(self._move_booking, telegram_id, zoom_date, True)
+        if reserved:
+            _user_cache.invalidate(telegram_id)
+            _notify_seats_changed()
+        return reserved
+    
+    def _p(self, query: str) -> str:
+        """Подставить плейсхолдеры текущей БД в динамический запрос, написанный с %s"""
+        return query if self.use_postgres else sql.to_sqlite(query)
+    
+    def _lock_for_write(self, cursor):
+        """SQLite: сразу взять блокировку на запись, чтобы чтение и запись в транзакции были атомарны"""
+        if not self.use_postgres and not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+    
+    def _move_booking(self, conn, telegram_id: int, zoom_date: str, enforce_capacity: bool) -> bool:
+        """Перенести участника на дату zoom_date и поправить счётчики date_capacity"""
         cursor = conn.cursor()
+        self._lock_for_write(cursor)
+        
+        row = self._run(cursor, sql.SELECT_PARTICIPANT_GROUP, (telegram_id,)).fetchone()
+        if not row:
+            return False
+        
+        old_date = row['zoom_date']
+        if old_date is not None and str(old_date) == zoom_date:
+            return True
         
+        if self.use_postgres and old_date is not None:
+            self._run(cursor, sql.LOCK_DATE_SEATS, (self._array({str(old_date), zoom_date}),))
+        
+        book = sql.BOOK_SEAT_IF_FREE if enforce_capacity else sql.BOOK_SEAT
+        if not self._run(cursor, book, (zoom_date, DEFAULT_DATE_CAPACITY)).fetchone():
+            return False
+        
+        self._run(cursor, sql.UPDATE_ZOOM_DATE, (zoom_date, telegram_id))
+        if old_date is not None:
+            self._run(cursor, sql.RELEASE_SEAT, (old_date,))
+        self._move_stats(cursor, self._stats_group(row), self._stats_group(row, zoom_date=zoom_date))
+        return True
+    
+    def _reconcile_date_capacity(self, cursor):
+        """Пересчитать booked в date_capacity по таблице participants"""
         if self.use_postgres:
-            cursor.execute(
-                "UPDATE participants SET email = %s WHERE telegram_id = %s",
-                (email, telegram_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE participants SET email = ? WHERE telegram_id = ?",
-                (email, telegram_id)
-            )
+            self._run(cursor, sql.LOCK_DATE_CAPACITY)
+        self._run(cursor, sql.RESET_BOOKED)
+        self._run(cursor, sql.RECOUNT_BOOKED, (DEFAULT_DATE_CAPACITY,))
+    
+    def reconcile_date_capacity(self):
+        """Пересчитать счётчики дат (если они разошлись с таблицей участников)"""
+        self._write(lambda conn: self._reconcile_date_capacity(conn.cursor()))
+        _notify_seats_changed()
+    
+    @staticmethod
+    def _stats_group(row, **changes) -> Tuple[str, str, str, bool]:
+        """Ключ строки registration_stats для участника (NULL -> ''); changes — новые значения полей"""
+        def value(name):
+            return changes[name] if name in changes else row[name]
         
-        conn.commit()
-        conn.close()
+        zoom_date = value('zoom_date')
+        return (
+            str(zoom_date) if zoom_date else '',
+            value('language') or '',
+            value('participant_type') or '',
+            bool(value('is_activated')),
+        )
     
-    def get_participants_count_by_date(self, zoom_date: str) -> int:
-        """Получить количество участников на дату"""
+    def _add_stats(self, cursor, deltas: Dict[Tuple[str, str, str, bool], int]):
+        """
+        Изменить счётчики registration_stats в текущей транзакции.
+        Группы обновляются в порядке ключа, чтобы встречные транзакции не блокировали друг друга.
+        """
+        for group in sorted(deltas):
+            if deltas[group]:
+                self._run(cursor, sql.ADD_REGISTRATION_STATS, group + (deltas[group],))
+    
+    def _move_stats(self, cursor, old_group: Tuple[str, str, str, bool], new_group: Tuple[str, str, str, bool]):
+        """Перенести одного участника из группы old_group в new_group"""
+        if old_group != new_group:
+            self._add_stats(cursor, {old_group: -1, new_group: 1})
+    
+    def _reconcile_registration_stats(self, cursor):
+        """
+        Пересчитать registration_stats по таблице participants.
+        PostgreSQL: сначала блокировка таблицы — иначе DELETE всех строк идёт в
+        физическом порядке, а _add_stats в порядке ключа, и транзакции взаимно блокируются
+        (deadlock); заодно пересчёт не теряет дельты незавершённых транзакций
+        """
         if self.use_postgres:
-            # Для COUNT используем обычный курсор без dict_row
-            import psycopg
-            conn = psycopg.connect(DATABASE_URL)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM participants WHERE zoom_date = %s",
-                (zoom_date,)
-            )
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count
-        else:
-            conn = sqlite3.connect(self.db_path)
+            self._run(cursor, sql.LOCK_REGISTRATION_STATS)
+        self._run(cursor, sql.RESET_REGISTRATION_STATS)
+        self._run(cursor, sql.RECOUNT_REGISTRATION_STATS)
+    
+    def reconcile_registration_stats(self):
+        """Пересчитать сводную статистику (если она разошлась с таблицей участников)"""
+        def reconcile(conn):
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM participants WHERE zoom_date = ?",
-                (zoom_date,)
-            )
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count
+            self._lock_for_write(cursor)
+            self._reconcile_registration_stats(cursor)
+        
+        self._write(reconcile)
+    
+    def set_date_capacity(self, zoom_date: str, capacity: int):
+        """Задать вместимость встречи на конкретную дату"""
+        self._write(self._execute, sql.SET_DATE_CAPACITY, (zoom_date, capacity))
+        _notify_seats_changed()
+    
+    def get_dates_capacity(self, zoom_dates: List[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Вместимость и число записанных для списка дат (один запрос).
+        Возвращает {дата: {'capacity': ..., 'booked': ...}}
+        """
+        result = {
+            date: {'capacity': DEFAULT_DATE_CAPACITY, 'booked': 0}
+            for date in zoom_dates
+        }
+        if not zoom_dates:
+            return result
+        
+        # Список дат — один параметр, поэтому текст запроса не зависит от их числа
+        with self.connection() as conn:
+            rows = self._run(conn.cursor(), sql.SELECT_DATES_CAPACITY, (self._array(zoom_dates),)).fetchall()
+        
+        for row in rows:
+            result[str(row['zoom_date'])] = {'capacity': row['capacity'], 'booked': row['booked']}
+        return result
+    
+    def update_user_email(self, telegram_id: int, email: str):
+        """Обновить email пользователя"""
+        self._write(self._execute, sql.UPDATE_EMAIL, (email, telegram_id))
+        _user_cache.invalidate(telegram_id)
+    
+    def get_participants_count_by_date(self, zoom_date: str) -> int:
+        """Получить количество участников на дату"""
+        return self.get_dates_capacity([zoom_date])[zoom_date]['booked']
     
     def set_user_language(self, telegram_id: int, language: str):
         """Установить язык пользователя"""
-        conn = self.get_connection()
+        self._write(self._change_language, telegram_id, language)
+        _user_cache.invalidate(telegram_id)
+    
+    def _change_language(self, conn, telegram_id: int, language: str):
         cursor = conn.cursor()
+        self._lock_for_write(cursor)
         
-        if self.use_postgres:
-            cursor.execute(
-                "UPDATE participants SET language = %s WHERE telegram_id = %s",
-                (language, telegram_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE participants SET language = ? WHERE telegram_id = ?",
-                (language, telegram_id)
-            )
+        row = self._run(cursor, sql.SELECT_PARTICIPANT_GROUP, (telegram_id,)).fetchone()
+        if not row:
+            return
         
-        conn.commit()
-        conn.close()
+        self._run(cursor, sql.UPDATE_LANGUAGE, (language, telegram_id))
+        self._move_stats(cursor, self._stats_group(row), self._stats_group(row, language=language))
     
     def set_user_email(self, telegram_id: int, email: str):
         """Установить email пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if self.use_postgres:
-            cursor.execute(
-                "UPDATE participants SET email = %s WHERE telegram_id = %s",
-                (email, telegram_id)
-            )
-        else:
-            cursor.execute(
-                "UPDATE participants SET email = ? WHERE telegram_id = ?",
-                (email, telegram_id)
-            )
-        
-        conn.commit()
-        conn.close()
+        self._write(self._execute, sql.UPDATE_EMAIL, (email, telegram_id))
+        _user_cache.invalidate(telegram_id)
     
     def get_user_by_email(self, email: str) -> Optional[Dict]:
-        """Получить пользователя по email"""
-        conn = self.get_connection()
+        """Получить пользователя по email без учёта регистра (через кэш)"""
+        cached = _user_cache.get_by_email(email)
+        if cached is not None:
+            return cached
         
-        if self.use_postgres:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE email = %s",
-                (email,)
-            )
-            user = cursor.fetchone()
-        else:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE email = ?",
-                (email,)
-            )
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                user = dict(zip(columns, row))
-            else:
-                user = None
+        generation = _user_cache.generation()
+        with self.connection() as conn:
+            row = self._run(conn.cursor(), sql.SELECT_USER_BY_EMAIL, (email,)).fetchone()
         
-        conn.close()
-        return user
+        if row:
+            user = dict(row)
+            _user_cache.put(user, generation)
+            return dict(user)
+        return None
     
     def get_user_language(self, telegram_id: int) -> str:
         """Получить язык пользователя (по умолчанию 'ru')"""
@@ -355,80 +1043,252 @@ class Database:
     
     def activate_user(self, activation_code: str) -> bool:
         """Активировать пользователя по коду"""
-        conn = self.get_connection()
+        telegram_ids = self._write(self._activate_code, activation_code, self._ts(datetime.now()))
+        _user_cache.invalidate(*telegram_ids)
+        return len(telegram_ids) > 0
+    
+    def _activate_code(self, conn, activation_code: str, activation_date) -> List[int]:
+        """Активировать по коду, вернуть telegram_id (для _write)"""
         cursor = conn.cursor()
+        self._lock_for_write(cursor)
         
-        activation_date = datetime.now()
-        
-        if self.use_postgres:
-            cursor.execute(
-                "UPDATE participants SET is_activated = TRUE, activation_date = %s WHERE activation_code = %s",
-                (activation_date, activation_code)
-            )
-        else:
-            cursor.execute(
-                "UPDATE participants SET is_activated = 1, activation_date = ? WHERE activation_code = ?",
-                (activation_date.isoformat(), activation_code)
-            )
-        
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        
-        return rows_affected > 0
+        group = self._run(cursor, sql.SELECT_PARTICIPANT_GROUP_BY_CODE, (activation_code,)).fetchone()
+        telegram_ids = [
+            row['telegram_id']
+            for row in self._run(cursor, sql.ACTIVATE_BY_CODE, (activation_date, activation_code)).fetchall()
+        ]
+        if group and not group['is_activated']:
+            self._move_stats(cursor, self._stats_group(group), self._stats_group(group, is_activated=True))
+        return telegram_ids
     
-    def activate_users_bulk(self, activation_codes: List[str]) -> tuple[int, int]:
-        """Массовая активация пользователей. Возвращает (успешно, ошибок)"""
-        success = 0
-        failed = 0
+    def activate_users_bulk(self, activation_codes: List[str]) -> Dict[str, List[str]]:
+        """
+        Массовая активация одним запросом.
+        Возвращает {'activated': [...], 'already_active': [...], 'unknown': [...]}
+        """
+        codes = list(dict.fromkeys(activation_codes))  # без повторов, порядок сохраняется
+        report = {'activated': [], 'already_active': [], 'unknown': []}
+        if not codes:
+            return report
         
-        for code in activation_codes:
-            if self.activate_user(code):
-                success += 1
-            else:
-                failed += 1
+        status, activated_ids = self._write(self._activate_codes, codes, datetime.now())
+        _user_cache.invalidate(*activated_ids)
         
-        return success, failed
+        for code in codes:
+            report[status[code]].append(code)
+        return report
     
-    def get_all_participants(self) -> List[Dict]:
-        """Получить всех участников (для админки)"""
-        conn = self.get_connection()
+    def _activate_codes(self, conn, codes: List[str], activation_date: datetime):
+        """Активировать коды, вернуть ({код: статус}, [telegram_id активированных])"""
+        cursor = conn.cursor()
+        self._lock_for_write(cursor)
         
-        if self.use_postgres:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM participants ORDER BY registration_date DESC")
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM participants ORDER BY registration_date DESC")
+        activated = self._run(
+            cursor, sql.ACTIVATE_BY_CODES, (self._ts(activation_date), self._array(codes))
+        ).fetchall()
+        known = {
+            row['activation_code']
+            for row in self._run(cursor, sql.SELECT_KNOWN_ACTIVATION_CODES, (self._array(codes),)).fetchall()
+        }
+        activated_codes = {row['activation_code'] for row in activated}
+        status = {
+            code: (
+                'activated' if code in activated_codes
+                else 'already_active' if code in known
+                else 'unknown'
+            )
+            for code in codes
+        }
         
-        rows = cursor.fetchall()
-        conn.close()
+        stats = {}
+        for row in activated:
+            for group, delta in ((self._stats_group(row, is_activated=False), -1),
+                                 (self._stats_group(row, is_activated=True), 1)):
+                stats[group] = stats.get(group, 0) + delta
+        self._add_stats(cursor, stats)
+        return status, [row['telegram_id'] for row in activated]
+    
+    def get_participant_counts(self) -> List[Dict[str, Any]]:
+        """
+        Агрегаты для статистики из сводной таблицы registration_stats: по каждой группе
+        (zoom_date, language, participant_type) — всего и активировано
+        """
+        with self.connection() as conn:
+            rows = self._run(conn.cursor(), sql.SELECT_REGISTRATION_STATS).fetchall()
         
         return [dict(row) for row in rows]
     
-    def get_participants_by_date(self, zoom_date: str) -> List[Dict]:
-        """Получить участников по дате"""
-        conn = self.get_connection()
-        
+    def get_media_file_id(self, content_hash: str, media_type: str) -> Optional[str]:
+        """file_id Telegram, сохранённый для файла с этим хэшем (см. media.py)"""
+        with self.connection() as conn:
+            row = self._run(conn.cursor(), sql.SELECT_MEDIA_FILE_ID, (content_hash, media_type)).fetchone()
+        return row['file_id'] if row else None
+    
+    def save_media_file_id(self, content_hash: str, media_type: str, file_id: str):
+        """Запомнить file_id Telegram для файла с этим хэшем"""
+        self._write(
+            self._execute, sql.SAVE_MEDIA_FILE_ID,
+            (content_hash, media_type, file_id, self._ts(datetime.now()))
+        )
+    
+    def forget_media_file_id(self, content_hash: str, media_type: str, file_id: str):
+        """Удалить устаревший file_id (Telegram его больше не принимает)"""
+        self._write(self._execute, sql.DELETE_MEDIA_FILE_ID, (content_hash, media_type, file_id))
+    
+    def _select_list(self, columns: Optional[Sequence[str]]) -> Tuple[str, ...]:
+        """Проверить набор колонок для выборки (по умолчанию — все)"""
+        columns = tuple(columns) if columns else PARTICIPANT_COLUMNS
+        unknown = set(columns) - set(PARTICIPANT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные колонки participants: {', '.join(sorted(unknown))}")
+        return columns
+    
+    def _tuple_cursor(self, conn, name: Optional[str] = None):
+        """Курсор, возвращающий строки кортежами (без промежуточных dict / sqlite3.Row)"""
         if self.use_postgres:
+            if name:
+                return conn.cursor(name=name, row_factory=tuple_row)
+            return conn.cursor(row_factory=tuple_row)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor
+    
+    def _fetch_participants(self, query: str, params: tuple, columns: Tuple[str, ...]) -> List[Participant]:
+        """Выполнить выборку участников и вернуть строки типа Participant"""
+        row_type = participant_row_type(columns)
+        with self.connection() as conn:
+            cursor = self._tuple_cursor(conn)
+            cursor.execute(self._p(query.format(columns=', '.join(columns))), params)
+            return list(map(row_type._make, cursor.fetchall()))
+    
+    def get_recent_participants(self, limit: int = 20, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        """Последние зарегистрированные участники"""
+        return self._fetch_participants(
+            "SELECT {columns} FROM participants ORDER BY registration_date DESC LIMIT %s",
+            (limit,),
+            self._select_list(columns)
+        )
+    
+    def _iter_query(
+        self,
+        query: str,
+        params: tuple = (),
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> Iterator[Participant]:
+        """
+        Потоковое чтение участников пачками по batch_size строк.
+        В PostgreSQL используется серверный (именованный) курсор, поэтому
+        в памяти одновременно находится не больше одной пачки.
+        """
+        columns = self._select_list(columns)
+        row_type = participant_row_type(columns)
+        with self.connection() as conn:
+            name = f"stream_{next(_cursor_names)}" if self.use_postgres else None
+            cursor = self._tuple_cursor(conn, name)
+            if self.use_postgres:
+                cursor.itersize = batch_size
+            
+            try:
+                cursor.execute(self._p(query.format(columns=', '.join(columns))), params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from map(row_type._make, rows)
+            finally:
+                cursor.close()
+    
+    def _participant_where(self, filters: Optional[Dict[str, Any]]) -> Tuple[str, list]:
+        """Условие WHERE и параметры для фильтров (пустые значения пропускаются)"""
+        conditions = []
+        params = []
+        for name, value in (filters or {}).items():
+            if name not in PARTICIPANT_FILTERS:
+                raise ValueError(f"Неизвестный фильтр участников: {name}")
+            if value is None or value == '':
+                continue
+            conditions.append(PARTICIPANT_FILTERS[name])
+            params.append(value)
+        return " AND ".join(conditions) or "TRUE", params
+    
+    def iter_participants(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> Iterator[Participant]:
+        """
+        Потоковая выборка участников по фильтрам (все условия — в SQL).
+        filters: language, participant_type, date_from, date_to, zoom_date, is_activated
+        """
+        where, params = self._participant_where(filters)
+        return self._iter_query(
+            f"SELECT {{columns}} FROM participants WHERE {where} ORDER BY registration_date",
+            tuple(params),
+            columns=columns,
+            batch_size=batch_size
+        )
+    
+    def iter_all_participants(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> Iterator[Participant]:
+        """Все участники (новые первыми) без загрузки всей таблицы в память"""
+        return self._iter_query(
+            "SELECT {columns} FROM participants ORDER BY registration_date DESC",
+            columns=columns,
+            batch_size=batch_size
+        )
+    
+    def count_participants(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """Количество участников по фильтрам (без выборки строк)"""
+        where, params = self._participant_where(filters)
+        with self.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE zoom_date = %s ORDER BY registration_date",
-                (zoom_date,)
-            )
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM participants WHERE zoom_date = ? ORDER BY registration_date",
-                (zoom_date,)
-            )
-        
-        rows = cursor.fetchall()
-        conn.close()
+            cursor.execute(self._p(f"SELECT COUNT(*) AS total FROM participants WHERE {where}"), tuple(params))
+            return cursor.fetchone()['total']
+    
+    def get_telegram_ids_page(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        after_telegram_id: Optional[int] = None,
+        limit: int = STREAM_BATCH_SIZE
+    ) -> List[int]:
+        """
+        Следующая страница Telegram ID по фильтрам (по возрастанию, после after_telegram_id).
+        Каждая страница — отдельный короткий запрос, поэтому долгая рассылка
+        не держит открытыми курсор и транзакцию.
+        """
+        where, params = self._participant_where(filters)
+        if after_telegram_id is not None:
+            where += " AND telegram_id > %s"
+            params.append(after_telegram_id)
+        params.append(limit)
         
-        return [dict(row) for row in rows]
+        with self.connection() as conn:
+            cursor = self._tuple_cursor(conn)
+            cursor.execute(self._p(
+                f"SELECT telegram_id FROM participants WHERE {where} ORDER BY telegram_id LIMIT %s"
+            ), tuple(params))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_all_participants(self, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        """Получить всех участников (для админки)"""
+        return self._fetch_participants(
+            "SELECT {columns} FROM participants ORDER BY registration_date DESC",
+            (),
+            self._select_list(columns)
+        )
+    
+    def get_participants_by_date(self, zoom_date: str, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        """Получить участников по дате (columns — только нужные колонки)"""
+        return self._fetch_participants(
+            "SELECT {columns} FROM participants WHERE zoom_date = %s ORDER BY registration_date",
+            (zoom_date,),
+            self._select_list(columns)
+        )
     
     def get_participants_by_category(
         self,
@@ -436,59 +1296,180 @@ class Database:
         participant_type: Optional[str] = None,
         date_from: Optional[str] = None,
         date_to: Optional[str] = None,
-        zoom_date: Optional[str] = None
-    ) -> List[Dict]:
-        """Получить участников по категориям для рассылки"""
-        conn = self.get_connection()
-        
-        query = "SELECT * FROM participants WHERE 1=1"
-        params = []
-        
-        if language:
-            if self.use_postgres:
-                query += " AND language = %s"
-            else:
-                query += " AND language = ?"
-            params.append(language)
-        
-        if participant_type:
-            if self.use_postgres:
-                query += " AND participant_type = %s"
-            else:
-                query += " AND participant_type = ?"
-            params.append(participant_type)
-        
-        if date_from:
-            if self.use_postgres:
-                query += " AND registration_date >= %s"
-            else:
-                query += " AND registration_date >= ?"
-            params.append(date_from)
-        
-        if date_to:
-            if self.use_postgres:
-                query += " AND registration_date <= %s"
-            else:
-                query += " AND registration_date <= ?"
-            params.append(date_to)
-        
-        if zoom_date:
-            if self.use_postgres:
-                query += " AND zoom_date = %s"
-            else:
-                query += " AND zoom_date = ?"
-            params.append(zoom_date)
-        
-        if self.use_postgres:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(params))
-        else:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(params))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [dict(row) for row in rows]
+        zoom_date: Optional[str] = None,
+        is_activated: Optional[bool] = None,
+        columns: Optional[Sequence[str]] = None
+    ) -> List[Participant]:
+        """Получить участников по категориям для рассылки (для больших выборок — iter_participants)"""
+        where, params = self._participant_where({
+            'language': language,
+            'participant_type': participant_type,
+            'date_from': date_from,
+            'date_to': date_to,
+            'zoom_date': zoom_date,
+            'is_activated': is_activated,
+        })
+        return self._fetch_participants(
+            f"SELECT {{columns}} FROM participants WHERE {where} ORDER BY registration_date",
+            tuple(params),
+            self._select_list(columns)
+        )
+
 
+class AsyncDatabase:
+    """
+    Асинхронный интерфейс к Database для обработчиков бота.
+    Запросы выполняются в отдельном пуле потоков (по размеру пула соединений),
+    поэтому медленный запрос не останавливает event loop для остальных пользователей.
+    """
+    
+    def __init__(self, db: Optional[Database] = None, max_workers: Optional[int] = None):
+        self.sync = db or Database()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or POOL_MAX_SIZE,
+            thread_name_prefix='db'
+        )
+    
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную функцию в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        # Попадание в кэш обслуживается сразу, без перехода в поток БД
+        cached = _user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        return await self.run(self.sync._read_user, telegram_id)
+    
+    async def get_user_by_email(self, email: str) -> Optional[Dict]:
+        return await self.run(self.sync.get_user_by_email, email)
+    
+    async def get_user_language(self, telegram_id: int) -> str:
+        user = await self.get_user(telegram_id)
+        if user and 'language' in user:
+            return user['language'] or 'ru'
+        return 'ru'
+    
+    async def create_user(
+        self,
+        telegram_id: int,
+        username: str,
+        first_name: str,
+        participant_type: str,
+        language: str = 'ru'
+    ) -> tuple[int, str]:
+        return await self.run(
+            self.sync.create_user,
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            participant_type=participant_type,
+            language=language
+        )
+    
+    async def register_participant(
+        self,
+        telegram_id: int,
+        username: str,
+        first_name: str,
+        participant_type: str,
+        language: str = 'ru',
+        zoom_date: Optional[str] = None,
+        email: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        return await self.run(
+            self.sync.register_participant,
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            participant_type=participant_type,
+            language=language,
+            zoom_date=zoom_date,
+            email=email
+        )
+    
+    async def update_zoom_date(self, telegram_id: int, zoom_date: str):
+        return await self.run(self.sync.update_zoom_date, telegram_id, zoom_date)
+    
+    async def reserve_seat(self, telegram_id: int, zoom_date: str) -> bool:
+        return await self.run(self.sync.reserve_seat, telegram_id, zoom_date)
+    
+    async def update_user_email(self, telegram_id: int, email: str):
+        return await self.run(self.sync.update_user_email, telegram_id, email)
+    
+    async def set_user_language(self, telegram_id: int, language: str):
+        return await self.run(self.sync.set_user_language, telegram_id, language)
+    
+    async def set_user_email(self, telegram_id: int, email: str):
+        return await self.run(self.sync.set_user_email, telegram_id, email)
+    
+    async def get_participants_count_by_date(self, zoom_date: str) -> int:
+        return await self.run(self.sync.get_participants_count_by_date, zoom_date)
+    
+    async def get_dates_capacity(self, zoom_dates: List[str]) -> Dict[str, Dict[str, int]]:
+        return await self.run(self.sync.get_dates_capacity, zoom_dates)
+    
+    async def set_date_capacity(self, zoom_date: str, capacity: int):
+        return await self.run(self.sync.set_date_capacity, zoom_date, capacity)
+    
+    async def activate_user(self, activation_code: str) -> bool:
+        return await self.run(self.sync.activate_user, activation_code)
+    
+    async def get_media_file_id(self, content_hash: str, media_type: str) -> Optional[str]:
+        return await self.run(self.sync.get_media_file_id, content_hash, media_type)
+    
+    async def save_media_file_id(self, content_hash: str, media_type: str, file_id: str):
+        return await self.run(self.sync.save_media_file_id, content_hash, media_type, file_id)
+    
+    async def forget_media_file_id(self, content_hash: str, media_type: str, file_id: str):
+        return await self.run(self.sync.forget_media_file_id, content_hash, media_type, file_id)
+    
+    async def reconcile_registration_stats(self):
+        return await self.run(self.sync.reconcile_registration_stats)
+    
+    async def activate_users_bulk(self, activation_codes: List[str]) -> Dict[str, List[str]]:
+        return await self.run(self.sync.activate_users_bulk, activation_codes)
+    
+    async def get_participant_counts(self) -> List[Dict[str, Any]]:
+        return await self.run(self.sync.get_participant_counts)
+    
+    async def get_recent_participants(self, limit: int = 20, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        return await self.run(self.sync.get_recent_participants, limit, columns)
+    
+    async def get_all_participants(self, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        return await self.run(self.sync.get_all_participants, columns)
+    
+    async def get_participants_by_date(self, zoom_date: str, columns: Optional[Sequence[str]] = None) -> List[Participant]:
+        return await self.run(self.sync.get_participants_by_date, zoom_date, columns)
+    
+    async def get_participants_by_category(self, **filters) -> List[Participant]:
+        return await self.run(self.sync.get_participants_by_category, **filters)
+    
+    async def count_participants(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        return await self.run(self.sync.count_participants, filters)
+    
+    async def get_telegram_ids_page(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        after_telegram_id: Optional[int] = None,
+        limit: int = STREAM_BATCH_SIZE
+    ) -> List[int]:
+        return await self.run(self.sync.get_telegram_ids_page, filters, after_telegram_id, limit)
+    
+    async def pool_stats(self) -> Dict[str, Any]:
+        return await self.run(self.sync.pool_stats)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.sync.cache_stats()
+    
+    def query_stats(self) -> Dict[str, Dict[str, Any]]:
+        return self.sync.query_stats()
+    
+    def prometheus_metrics(self) -> str:
+        return self.sync.prometheus_metrics()
+    
+    def close(self):
+        """Остановить пул потоков и закрыть соединения"""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
@@ -0,0 +1,176 @@
+"""
+Выбор даты встречи: три ближайших дня с заполненностью (Telegram- и Email-бот)
+Подписи и счётчики кэшируются по (язык, календарный день), так что поток новых
+пользователей не обращается к БД. Кэш сбрасывается, когда Database сообщает
+об изменении мест, при смене дня и не реже раза в DATE_PICKER_TTL секунд
+(на случай записей из других процессов).
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from database import add_seats_listener
+
+# Максимальный возраст счётчиков в кэше (секунды)
+DATE_PICKER_TTL = float(os.getenv("DATE_PICKER_TTL", "30"))
+
+WEEKDAY_NAMES = {
+    'ru': ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье'],
+    'en': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+    'he': ['יום שני', 'יום שלישי', 'יום רביעי', 'יום חמישי', 'יום שישי', 'שבת', 'יום ראשון']
+}
+
+# Сегодня, завтра, послезавтра
+RELATIVE_NAMES = {
+    'ru': ['Сегодня', 'Завтра', 'Послезавтра'],
+    'en': ['Today', 'Tomorrow', 'Day after tomorrow'],
+    'he': ['היום', 'מחר', 'מחרתיים']
+}
+
+# Дата в выборе: подпись без счётчиков, записано и вместимость
+DateOption = namedtuple('DateOption', ['date_str', 'label', 'booked', 'capacity'])
+
+# Готовый вид выбора даты на одном языке: варианты и клавиатура Telegram
+DateView = namedtuple('DateView', ['options', 'keyboard'])
+
+
+def get_next_three_days(today: Optional[datetime] = None) -> List[datetime]:
+    """
+    Возвращает список из 3 ближайших дней (исключая пятницу и субботу)
+    """
+    days = []
+    current = today or datetime.now()
+    
+    while len(days) < 3:
+        # Пропускаем пятницу (4) и субботу (5)
+        if current.weekday() not in [4, 5]:
+            days.append(current)
+        current += timedelta(days=1)
+    
+    return days
+
+
+def format_date_button(date: datetime, language: str, index: int) -> str:
+    """Форматирует дату для кнопки в зависимости от языка"""
+    date_str = date.strftime('%d.%m.%Y')
+    day_name = WEEKDAY_NAMES.get(language, WEEKDAY_NAMES['ru'])[date.weekday()]
+    relative = RELATIVE_NAMES.get(language, RELATIVE_NAMES['ru'])[index] if index < 3 else ''
+    
+    if relative:
+        return f"{relative} ({day_name}) - {date_str}"
+    else:
+        return f"{day_name} - {date_str}"
+
+
+def button_text(option: DateOption) -> str:
+    """Подпись кнопки с заполненностью"""
+    if option.booked >= option.capacity:
+        return f"{option.label} ❌ FULL"
+    return f"{option.label} ({option.booked}/{option.capacity})"
+
+
+class DatePicker:
+    """Потокобезопасный кэш выбора даты (общий для обоих ботов в процессе)"""
+    
+    def __init__(self, ttl: float = DATE_PICKER_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._dates: List[datetime] = []
+        self._capacity: Optional[Dict[str, Dict[str, int]]] = None
+        self._loaded_at = 0.0
+        self._views: Dict[Tuple[str, date], DateView] = {}
+        # Счётчик сбросов: загруженное до сброса в кэш уже не попадёт
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def invalidate(self):
+        """Сбросить счётчики и готовые виды (места на датах изменились)"""
+        with self._lock:
+            self._version += 1
+            self._capacity = None
+            self._views.clear()
+    
+    def get_view(self, language: str, load_capacity: Callable[[List[str]], Dict[str, Dict[str, int]]]) -> DateView:
+        """Вид выбора даты; load_capacity — Database.get_dates_capacity (вызывается только при промахе)"""
+        view, version, dates, capacity = self._lookup(language)
+        if view is not None:
+            return view
+        if capacity is None:
+            capacity = load_capacity([d.strftime('%Y-%m-%d') for d in dates])
+        return self._store(language, version, dates, capacity)
+    
+    async def get_view_async(
+        self,
+        language: str,
+        load_capacity: Callable[[List[str]], Awaitable[Dict[str, Dict[str, int]]]]
+    ) -> DateView:
+        """То же для AsyncDatabase.get_dates_capacity"""
+        view, version, dates, capacity = self._lookup(language)
+        if view is not None:
+            return view
+        if capacity is None:
+            capacity = await load_capacity([d.strftime('%Y-%m-%d') for d in dates])
+        return self._store(language, version, dates, capacity)
+    
+    def stats(self) -> Dict[str, int]:
+        return {'views': len(self._views), 'hits': self.hits, 'misses': self.misses}
+    
+    def _lookup(self, language: str):
+        """(готовый вид или None, версия, даты дня, уже загруженные счётчики или None)"""
+        today = date.today()
+        with self._lock:
+            if self._day != today:
+                # Новый день — новые три даты
+                self._version += 1
+                self._day = today
+                self._dates = get_next_three_days()
+                self._capacity = None
+                self._views.clear()
+            elif self._capacity is not None and time.monotonic() - self._loaded_at > self.ttl:
+                self._version += 1
+                self._capacity = None
+                self._views.clear()
+            
+            view = self._views.get((language, today))
+            if view is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return view, self._version, self._dates, self._capacity
+    
+    def _store(self, language: str, version: int, dates: List[datetime], capacity) -> DateView:
+        options = []
+        for i, d in enumerate(dates):
+            date_str = d.strftime('%Y-%m-%d')
+            seats = capacity[date_str]
+            options.append(DateOption(date_str, format_date_button(d, language, i), seats['booked'], seats['capacity']))
+        options = tuple(options)
+        
+        view = DateView(
+            options=options,
+            keyboard=InlineKeyboardMarkup([
+                [InlineKeyboardButton(button_text(option), callback_data=f'date_{option.date_str}')]
+                for option in options
+            ])
+        )
+        
+        with self._lock:
+            if version == self._version:
+                if self._capacity is None:
+                    self._capacity = capacity
+                    self._loaded_at = time.monotonic()
+                self._views[(language, self._day)] = view
+        return view
+
+
+# Общий кэш процесса; сбрасывается при каждом изменении мест через Database
+date_picker = DatePicker()
+add_seats_listener(date_picker.invalidate)
@@ -0,0 +1,204 @@
+"""
+Метрики вызовов базы данных: число вызовов, гистограммы задержек
+по методу и типу БД, журнал медленных запросов.
+Данные доступны через stats() и в текстовом формате Prometheus.
+"""
+
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import types
+from typing import Any, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Порог медленного вызова (миллисекунды)
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+# Границы корзин гистограммы (секунды)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class QueryMetrics:
+    """Потокобезопасные счётчики и гистограммы задержек по (метод, БД)"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS, slow_query_ms: float = SLOW_QUERY_MS):
+        self.buckets = buckets
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    
+    def record(self, method: str, backend: str, seconds: float, error: bool = False, args=(), kwargs=None):
+        """Учесть один вызов (args / kwargs нужны только для журнала медленных вызовов)"""
+        slow = seconds * 1000 >= self.slow_query_ms
+        with self._lock:
+            series = self._series.get((method, backend))
+            if series is None:
+                series = self._series[(method, backend)] = {
+                    'count': 0,
+                    'errors': 0,
+                    'slow': 0,
+                    'sum': 0.0,
+                    'max': 0.0,
+                    'buckets': [0] * len(self.buckets),
+                }
+            series['count'] += 1
+            series['sum'] += seconds
+            series['max'] = max(series['max'], seconds)
+            if error:
+                series['errors'] += 1
+            if slow:
+                series['slow'] += 1
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+                    break
+        
+        if slow:
+            logger.warning(
+                f"Slow DB call {method} [{backend}]: {seconds * 1000:.1f} ms, args {args_shape(args, kwargs or {})}"
+            )
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Сводка по методам: {'метод[БД]': {count, errors, slow, avg_ms, max_ms, p50_ms, p95_ms, p99_ms}}"""
+        with self._lock:
+            snapshot = {key: dict(series, buckets=list(series['buckets'])) for key, series in self._series.items()}
+        
+        result = {}
+        for (method, backend), series in sorted(snapshot.items()):
+            count = series['count']
+            result[f"{method}[{backend}]"] = {
+                'count': count,
+                'errors': series['errors'],
+                'slow': series['slow'],
+                'avg_ms': series['sum'] / count * 1000 if count else 0.0,
+                'max_ms': series['max'] * 1000,
+                'p50_ms': self._quantile(series, 0.50) * 1000,
+                'p95_ms': self._quantile(series, 0.95) * 1000,
+                'p99_ms': self._quantile(series, 0.99) * 1000,
+            }
+        return result
+    
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            snapshot = {key: dict(series, buckets=list(series['buckets'])) for key, series in self._series.items()}
+        
+        lines = [
+            "# HELP summit_db_call_duration_seconds Latency of Database method calls",
+            "# TYPE summit_db_call_duration_seconds histogram",
+        ]
+        for (method, backend), series in sorted(snapshot.items()):
+            labels = f'method="{method}",backend="{backend}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'summit_db_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'summit_db_call_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f'summit_db_call_duration_seconds_sum{{{labels}}} {series["sum"]}')
+            lines.append(f'summit_db_call_duration_seconds_count{{{labels}}} {series["count"]}')
+        
+        for name, key, help_text in (
+            ('summit_db_call_errors_total', 'errors', 'Database method calls that raised'),
+            ('summit_db_slow_calls_total', 'slow', 'Database method calls above DB_SLOW_QUERY_MS'),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, backend), series in sorted(snapshot.items()):
+                lines.append(f'{name}{{method="{method}",backend="{backend}"}} {series[key]}')
+        
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        """Сбросить все метрики"""
+        with self._lock:
+            self._series.clear()
+    
+    def _quantile(self, series: Dict[str, Any], q: float) -> float:
+        """Оценка квантиля по гистограмме (верхняя граница корзины)"""
+        rank = q * series['count']
+        cumulative = 0
+        for bound, count in zip(self.buckets, series['buckets']):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, series['max'])
+        return series['max']
+
+
+# Общие метрики процесса
+metrics = QueryMetrics()
+
+
+def args_shape(args: Iterable[Any], kwargs: Dict[str, Any]) -> str:
+    """Форма аргументов для журнала: типы и размеры без самих значений (персональные данные)"""
+    def shape(value):
+        if isinstance(value, (list, tuple, set, dict)):
+            return f"{type(value).__name__}[{len(value)}]"
+        if isinstance(value, str):
+            return f"str[{len(value)}]"
+        return type(value).__name__
+    
+    parts = [shape(value) for value in args]
+    parts += [f"{name}={shape(value)}" for name, value in kwargs.items()]
+    return f"({', '.join(parts)})"
+
+
+def _timed_iterator(iterator, method: str, backend: str, args, kwargs, started: float):
+    """Итератор-обёртка: учитывает время внутри выборки, без времени обработки строк вызывающим"""
+    elapsed = time.perf_counter() - started
+    error = False
+    try:
+        while True:
+            step = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - step
+                return
+            except BaseException:
+                elapsed += time.perf_counter() - step
+                error = True
+                raise
+            elapsed += time.perf_counter() - step
+            yield item
+    finally:
+        iterator.close()
+        metrics.record(method, backend, elapsed, error, args, kwargs)
+
+
+def instrument(include: Tuple[str, ...] = (), exclude: Tuple[str, ...] = ()):
+    """
+    Декоратор класса БД: оборачивает публичные методы (и перечисленные в include)
+    замером времени. Тип БД берётся из атрибута экземпляра backend.
+    """
+    def decorate(cls):
+        for name, func in list(vars(cls).items()):
+            if not inspect.isfunction(func) or name in exclude:
+                continue
+            if name.startswith('_') and name not in include:
+                continue
+            setattr(cls, name, _wrap(func, name))
+        return cls
+    return decorate
+
+
+def _wrap(func, name: str):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        backend = getattr(self, 'backend', 'unknown')
+        started = time.perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+        except BaseException:
+            metrics.record(name, backend, time.perf_counter() - started, True, args, kwargs)
+            raise
+        
+        if isinstance(result, types.GeneratorType):
+            # Потоковая выборка: время считается до исчерпания генератора
+            return _timed_iterator(result, name, backend, args, kwargs, started)
+        metrics.record(name, backend, time.perf_counter() - started, False, args, kwargs)
+        return result
+    return wrapper
@@ -9,12 +9,12 @@ import email
 from email.header import decode_header
 import time
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional, Dict
 import re
-import hashlib
 
-from database import Database
+from database import Database, email_to_telegram_id
+from date_picker import date_picker, get_next_three_days
 from email_sender import email_sender
 
 logger = logging.getLogger(__name__)
@@ -25,9 +25,6 @@ IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
 IMAP_USER = os.getenv("IMAP_USER", "")
 IMAP_PASSWORD = os.getenv("IMAP_PASSWORD", "")
 
-# Константы
-MAX_PARTICIPANTS_PER_DATE = 290
-
 # Тексты ТОЧНО как в WhatsApp боте
 TEXTS = {
     'ru': {
@@ -83,13 +80,6 @@ TEXTS = {
     }
 }
 
-# Названия дней недели
-WEEKDAY_NAMES = {
-    'ru': ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье'],
-    'en': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
-    'he': ['יום שני', 'יום שלישי', 'יום רביעי', 'יום חמישי', 'יום שישי', 'שבת', 'יום ראשון']
-}
-
 # Инициализация БД
 db = Database()
 
@@ -97,28 +87,6 @@ db = Database()
 user_states = {}
 
 
-def email_to_telegram_id(email_address: str) -> int:
-    """Генерирует уникальный отрицательный telegram_id из email"""
-    hash_object = hashlib.sha256(email_address.lower().encode())
-    hex_dig = hash_object.hexdigest()
-    return -int(hex_dig[:15], 16)
-
-
-def get_next_three_days():
-    """Получение следующих трёх дней (пропуск пятницы и субботы)"""
-    days = []
-    current = datetime.now()
-    
-    while len(days) < 3:
-        day_of_week = current.weekday()
-        # Пропускаем пятницу (4) и субботу (5)
-        if day_of_week not in [4, 5]:
-            days.append(current)
-        current += timedelta(days=1)
-    
-    return days
-
-
 def format_date(date):
     """Форматирование даты DD.MM.YYYY"""
     return date.strftime('%d.%m.%Y')
@@ -129,12 +97,6 @@ def format_date_for_db(date):
     return date.strftime('%Y-%m-%d')
 
 
-def get_weekday_name(date, language):
-    """Получение названия дня недели"""
-    day_index = date.weekday()
-    return WEEKDAY_NAMES[language][day_index]
-
-
 class EmailBot:
     """Email-бот с полным функционалом"""
     
@@ -262,19 +224,15 @@ class EmailBot:
         return db.get_user(telegram_id)
     
     def get_dates_message(self, language: str) -> str:
-        """Сформировать сообщение с датами"""
-        dates = get_next_three_days()
+        """Сформировать сообщение с датами (подписи и заполненность — из кэша date_picker)"""
         texts = TEXTS[language]
-        relative = [texts['today'], texts['tomorrow'], texts['day_after_tomorrow']]
         emojis = ['1️⃣', '2️⃣', '3️⃣']
         
         message = texts['greeting'] + '\n\n' + texts['choose_date'] + '\n\n'
         
-        for i, date in enumerate(dates):
-            weekday = get_weekday_name(date, language)
-            formatted = format_date(date)
-            count = db.get_participants_count_by_date(format_date_for_db(date))
-            message += f"{emojis[i]} {relative[i]} ({weekday}) - {formatted} ({count}/{MAX_PARTICIPANTS_PER_DATE})\n"
+        view = date_picker.get_view(language, db.get_dates_capacity)
+        for emoji, option in zip(emojis, view.options):
+            message += f"{emoji} {option.label} ({option.booked}/{option.capacity})\n"
         
         message += "\nОтветьте цифрой (1, 2 или 3)" if language == 'ru' else "\nReply with number (1, 2, or 3)" if language == 'en' else "\n(3 ,2 ,1) ענה במספר"
         
@@ -340,23 +298,23 @@ class EmailBot:
             
             if language:
                 if not user:
-                    # Создаем нового пользователя
+                    # Создаем нового пользователя (сразу с email, одной транзакцией)
                     first_name = from_email.split('@')[0]
-                    participant_id, activation_code = db.create_user(
+                    user = db.register_participant(
                         telegram_id=telegram_id,
                         username=from_email,
                         first_name=first_name,
                         participant_type='email_participant',
-                        language=language
+                        language=language,
+                        email=from_email
                     )
-                    db.update_user_email(telegram_id, from_email)
-                    user = db.get_user(telegram_id)
-                    logger.info(f"[EMAIL] User created: ID={participant_id}, Code={activation_code}")
+                    logger.info(f"[EMAIL] User created: ID={user['participant_id']}, Code={user['activation_code']}")
                 else:
                     # Обновляем язык для существующего пользователя
                     db.set_user_language(telegram_id, language)
-                    db.update_user_email(telegram_id, from_email)
-                    user = db.get_user(telegram_id)
+                    if user.get('email') != from_email:
+                        db.update_user_email(telegram_id, from_email)
+                    user = dict(user, language=language, email=from_email)
                 
                 # Отправляем список дат
                 dates_message = self.get_dates_message(language)
@@ -386,19 +344,17 @@ class EmailBot:
             
             if 0 <= date_index < len(dates):
                 selected_date = format_date_for_db(dates[date_index])
-                count = db.get_participants_count_by_date(selected_date)
                 
                 texts = TEXTS[user['language']]
                 
-                if count >= MAX_PARTICIPANTS_PER_DATE:
+                # Занимаем место (проверка лимита и запись атомарны)
+                if not db.reserve_seat(telegram_id, selected_date):
                     # Дата заполнена
                     full_message = texts['date_full'] + "\n\n" + self.get_dates_message(user['language'])
                     self.send_email(from_email, "❌ Date full / Дата заполнена", full_message)
                     return
                 
-                # Обновляем дату
-                db.update_zoom_date(telegram_id, selected_date)
-                user = db.get_user(telegram_id)
+                user = dict(user, zoom_date=selected_date)
                 
                 # Отправляем подтверждение с ID и кодом
                 confirmation = texts['meeting_confirmed'] + "\n\n" + texts['id_and_code'].replace('{participant_id}', str(user['participant_id'])).replace('{activation_code}', user['activation_code'])
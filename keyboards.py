@@ -0,0 +1,57 @@
+"""
+Готовые клавиатуры меню бота для каждого языка из TEXTS
+Строятся один раз при импорте, обработчики берут их по (язык, экран).
+Клавиатуры с данными из БД (выбор даты) строятся отдельно.
+"""
+
+from typing import Dict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from languages import TEXTS, LANGUAGE_NAMES, get_text
+
+# Экран -> кнопки сверху вниз: (ключ текста в TEXTS, callback_data)
+SCREENS = {
+    'main_menu': [
+        ('btn_remind_id', 'menu_remind_id'),
+        ('btn_remind_code', 'menu_remind_code'),
+        ('btn_remind_date', 'menu_remind_date'),
+        ('btn_reschedule', 'menu_reschedule'),
+        ('btn_how_activate', 'menu_how_activate'),
+        ('btn_change_language', 'menu_change_language'),
+    ],
+    'back': [
+        ('btn_back_to_menu', 'menu_back'),
+    ],
+    'how_activate': [
+        ('btn_instruction', 'menu_instruction'),
+        ('btn_back_to_menu', 'menu_back'),
+    ],
+}
+
+# Выбор языка одинаков для всех языков интерфейса
+LANGUAGE_PICKER = InlineKeyboardMarkup([
+    [InlineKeyboardButton(name, callback_data=f'lang_{code}')]
+    for code, name in LANGUAGE_NAMES.items()
+])
+
+
+def _build(language: str) -> Dict[str, InlineKeyboardMarkup]:
+    keyboards = {
+        screen: InlineKeyboardMarkup([
+            [InlineKeyboardButton(get_text(language, text_key), callback_data=callback_data)]
+            for text_key, callback_data in buttons
+        ])
+        for screen, buttons in SCREENS.items()
+    }
+    keyboards['language'] = LANGUAGE_PICKER
+    return keyboards
+
+
+# Разметка неизменяемая, поэтому одни и те же объекты отдаются всем пользователям
+KEYBOARDS = {language: _build(language) for language in TEXTS}
+
+
+def get_keyboard(language: str, screen: str) -> InlineKeyboardMarkup:
+    """Клавиатура экрана screen на языке language (неизвестный язык — русский)"""
+    return KEYBOARDS.get(language, KEYBOARDS['ru'])[screen]
@@ -0,0 +1,235 @@
+"""
+Служебные команды базы данных участников
+
+    python manage_db.py import registrations.csv
+    python manage_db.py import registrations.jsonl --chunk-size 10000
+    python manage_db.py migrate --sqlite-path summit_bot.db
+    python manage_db.py reconcile-stats
+    python manage_db.py set-capacity 2025-10-10 350
+
+Тип БД определяется как у бота: DATABASE_URL (PostgreSQL) или файл SQLite.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения до импорта database (DATABASE_URL)
+load_dotenv()
+
+from database import Database, IMPORT_CHUNK_SIZE, PARTICIPANT_COLUMNS, STREAM_BATCH_SIZE, checksum_rows
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def read_rows(path: str, file_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Построчное чтение файла регистраций: CSV (заголовок — имена колонок),
+    JSON Lines (объект на строку) или JSON (список объектов, читается целиком)
+    """
+    if file_format is None:
+        if path.endswith('.csv'):
+            file_format = 'csv'
+        elif path.endswith(('.jsonl', '.ndjson')):
+            file_format = 'jsonl'
+        else:
+            file_format = 'json'
+
+    if file_format == 'csv':
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            yield from csv.DictReader(f)
+    elif file_format == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else data.get('participants', []))
+
+
+def cmd_import(args) -> int:
+    """Импорт регистраций с сайта"""
+    db = Database(args.db_path)
+    started = time.perf_counter()
+    try:
+        report = db.bulk_import_participants(
+            read_rows(args.file, args.format),
+            chunk_size=args.chunk_size
+        )
+    finally:
+        db.close()
+
+    logger.info(
+        f"Import finished in {time.perf_counter() - started:.1f}s: "
+        f"imported {report['imported']}, skipped {report['skipped']} (already registered), "
+        f"invalid {report['invalid']} (no telegram_id or email, or telegram_id not an integer)"
+    )
+    return 0
+
+
+def _to_date(value):
+    return date.fromisoformat(value[:10]) if isinstance(value, str) and value else value or None
+
+
+def _to_timestamp(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) and value else value or None
+
+
+def _to_bool(value):
+    return None if value is None else bool(int(value))
+
+
+# Приведение типов SQLite (TEXT / 0-1) к колонкам PostgreSQL
+SQLITE_CONVERTERS = {
+    'zoom_date': _to_date,
+    'registration_date': _to_timestamp,
+    'activation_date': _to_timestamp,
+    'is_activated': _to_bool,
+}
+
+
+def iter_sqlite_participants(path: str, batch_size: int) -> Iterator[Tuple[Any, ...]]:
+    """
+    Участники из файла SQLite (только чтение) в порядке id, пачками по batch_size,
+    в колонках PARTICIPANT_COLUMNS с типами PostgreSQL. Колонки, которых нет
+    в старой схеме (например, email), переносятся как NULL.
+    """
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        existing = {row[1] for row in source.execute("PRAGMA table_info(participants)")}
+        select = ', '.join(column if column in existing else f"NULL AS {column}" for column in PARTICIPANT_COLUMNS)
+        converters = [SQLITE_CONVERTERS.get(column) for column in PARTICIPANT_COLUMNS]
+
+        cursor = source.execute(f"SELECT {select} FROM participants ORDER BY id")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            for row in batch:
+                try:
+                    yield tuple(
+                        convert(value) if convert else value
+                        for convert, value in zip(converters, row)
+                    )
+                except ValueError as e:
+                    raise ValueError(f"participants.id = {row[0]}: {e}") from e
+    finally:
+        source.close()
+
+
+def cmd_migrate(args) -> int:
+    """Перенос участников из SQLite в PostgreSQL (DATABASE_URL) со сверкой"""
+    db = Database()
+    try:
+        if not db.use_postgres:
+            logger.error("DATABASE_URL is not set: nothing to migrate to")
+            return 1
+        if db.count_participants():
+            logger.error("Target PostgreSQL already has participants; migrate into an empty database")
+            return 1
+
+        started = time.perf_counter()
+        # Первый проход — контрольная сумма источника, второй — сама загрузка;
+        # сверка с PostgreSQL идёт до commit, при расхождении загрузка откатывается
+        expected = checksum_rows(iter_sqlite_participants(args.sqlite_path, args.batch_size))
+        loaded = db.load_participants(
+            iter_sqlite_participants(args.sqlite_path, args.batch_size),
+            expected=expected
+        )
+    finally:
+        db.close()
+
+    logger.info(
+        f"Migration finished in {time.perf_counter() - started:.1f}s: "
+        f"{loaded} participants, checksum {expected[1][:16]} verified"
+    )
+    return 0
+
+
+def cmd_reconcile_stats(args) -> int:
+    """Пересчёт сводной статистики и счётчиков мест по таблице участников"""
+    db = Database(args.db_path)
+    started = time.perf_counter()
+    try:
+        before = db.get_participant_counts()
+        db.reconcile_registration_stats()
+        db.reconcile_date_capacity()
+        after = db.get_participant_counts()
+    finally:
+        db.close()
+
+    logger.info(
+        f"Stats reconciled in {time.perf_counter() - started:.1f}s: "
+        f"{len(after)} groups, drift {'fixed' if before != after else 'none'}"
+    )
+    return 0
+
+
+def cmd_set_capacity(args) -> int:
+    """Вместимость встречи на одну дату (по умолчанию — MAX_PARTICIPANTS_PER_DATE)"""
+    zoom_date = args.date.isoformat()
+    db = Database(args.db_path)
+    try:
+        db.set_date_capacity(zoom_date, args.capacity)
+        booked = db.get_dates_capacity([zoom_date])[zoom_date]['booked']
+    finally:
+        db.close()
+
+    logger.info(f"Capacity of {zoom_date} set to {args.capacity} ({booked} already booked)")
+    if booked > args.capacity:
+        # Записанные участники остаются, новых записей на дату не будет
+        logger.warning(f"{zoom_date} is overbooked by {booked - args.capacity}: existing bookings are kept")
+    return 0
+
+
+def non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("must be >= 0")
+    return number
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Служебные команды базы данных участников")
+    parser.add_argument('--db-path', default='summit_bot.db', help="файл SQLite (если не задан DATABASE_URL)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="импорт участников из CSV / JSON / JSON Lines")
+    import_parser.add_argument('file', help="файл с регистрациями")
+    import_parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help="по умолчанию — по расширению файла")
+    import_parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="строк в одной транзакции")
+    import_parser.set_defaults(func=cmd_import)
+
+    migrate_parser = commands.add_parser('migrate', help="перенос участников из SQLite в PostgreSQL (DATABASE_URL)")
+    migrate_parser.add_argument('--sqlite-path', default='summit_bot.db', help="исходный файл SQLite")
+    migrate_parser.add_argument('--batch-size', type=int, default=STREAM_BATCH_SIZE, help="строк SQLite за одно чтение")
+    migrate_parser.set_defaults(func=cmd_migrate)
+
+    reconcile_parser = commands.add_parser('reconcile-stats', help="пересчитать сводную статистику и места на датах")
+    reconcile_parser.set_defaults(func=cmd_reconcile_stats)
+
+    capacity_parser = commands.add_parser('set-capacity', help="задать вместимость встречи на дату")
+    capacity_parser.add_argument('date', type=date.fromisoformat, help="дата встречи, ГГГГ-ММ-ДД")
+    capacity_parser.add_argument('capacity', type=non_negative_int, help="мест на встрече")
+    capacity_parser.set_defaults(func=cmd_set_capacity)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
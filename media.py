@@ -0,0 +1,122 @@
+"""
+Реестр статичных файлов бота (логотип и другие картинки)
+Файл загружается в Telegram один раз, полученный file_id хранится в БД
+по хэшу содержимого и переиспользуется при всех следующих отправках.
+Если Telegram больше не принимает file_id — файл загружается заново.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Тип вложения -> метод Bot для отправки
+SENDERS = {
+    'photo': 'send_photo',
+    'document': 'send_document',
+    'video': 'send_video',
+    'animation': 'send_animation',
+}
+
+# Части текста BadRequest, по которым Telegram отклоняет сам file_id
+# (а не подпись, чат или другие параметры отправки)
+STALE_FILE_ID_ERRORS = (
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'file reference',
+    'file_reference',
+)
+
+
+def is_stale_file_id(error: BadRequest) -> bool:
+    """Telegram больше не принимает сохранённый file_id — файл нужно загрузить заново"""
+    message = error.message.lower()
+    return any(marker in message for marker in STALE_FILE_ID_ERRORS)
+
+
+class MediaRegistry:
+    """Отправка статичных файлов по file_id с загрузкой при первом использовании"""
+    
+    def __init__(self, db):
+        """db — AsyncDatabase (file_id хранятся в таблице media_cache)"""
+        self.db = db
+        self._file_ids: Dict[Tuple[str, str], str] = {}
+        # path -> ((mtime, размер), хэш): файл перечитывается только после изменения
+        self._hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+    
+    def content_hash(self, path: str) -> str:
+        """sha256 содержимого файла (пересчитывается, только если файл изменился)"""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._hashes[path] = (version, digest)
+        return digest
+    
+    async def send(self, bot: Bot, chat_id: int, path: str, media_type: str = 'photo', **kwargs) -> Message:
+        """Отправить файл path в чат (kwargs — как у send_photo / send_document, например caption)"""
+        send = getattr(bot, SENDERS[media_type])
+        key = (self.content_hash(path), media_type)
+        
+        file_id = await self._cached_file_id(key)
+        if file_id:
+            try:
+                return await send(chat_id, file_id, **kwargs)
+            except BadRequest as e:
+                # Остальные ошибки (подпись, чат и т.п.) повторная загрузка не исправит
+                if not is_stale_file_id(e):
+                    raise
+                logger.warning(f"Stale file_id for {path} ({e}), uploading again")
+                await self._forget(key, file_id)
+        
+        # Одна загрузка на файл: параллельные отправки ждут её и берут готовый file_id
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            file_id = self._file_ids.get(key)
+            if file_id:
+                return await send(chat_id, file_id, **kwargs)
+            
+            with open(path, 'rb') as f:
+                message = await send(chat_id, f, **kwargs)
+            
+            file_id = self._file_id_from(message, media_type)
+            if file_id:
+                self._file_ids[key] = file_id
+                await self.db.save_media_file_id(key[0], media_type, file_id)
+                logger.info(f"Uploaded {path} to Telegram, file_id cached")
+            return message
+    
+    async def send_photo(self, bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+        return await self.send(bot, chat_id, path, 'photo', **kwargs)
+    
+    async def _cached_file_id(self, key: Tuple[str, str]) -> Optional[str]:
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await self.db.get_media_file_id(*key)
+            if file_id:
+                self._file_ids[key] = file_id
+        return file_id
+    
+    async def _forget(self, key: Tuple[str, str], file_id: str):
+        if self._file_ids.get(key) == file_id:
+            del self._file_ids[key]
+        await self.db.forget_media_file_id(key[0], key[1], file_id)
+    
+    @staticmethod
+    def _file_id_from(message: Message, media_type: str) -> Optional[str]:
+        """file_id из ответа Telegram (для фото — самый крупный размер)"""
+        if media_type == 'photo':
+            return message.photo[-1].file_id if message.photo else None
+        attachment = getattr(message, media_type, None)
+        return attachment.file_id if attachment else None
@@ -0,0 +1,259 @@
+"""
+Версионированные миграции схемы БД (PostgreSQL / SQLite)
+Номер последней применённой миграции хранится в таблице schema_version.
+Если схема актуальна, при запуске выполняется один SELECT и никакого DDL.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from database import FIRST_PARTICIPANT_ID
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL: миграции не запускаются параллельно из нескольких процессов
+MIGRATION_LOCK_ID = 720_120_001
+
+# SQLite: сколько ждать, пока миграции применяет другой поток или процесс (секунды).
+# Заполнение пула кодов идёт несколько секунд — дольше обычного SQLITE_TIMEOUT
+MIGRATION_LOCK_TIMEOUT = float(os.getenv("MIGRATION_LOCK_TIMEOUT", "600"))
+
+
+def _create_participants(db, cursor):
+    """Таблица участников и поле email"""
+    if db.use_postgres:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS participants (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                email TEXT,
+                participant_type TEXT,
+                participant_id INTEGER UNIQUE,
+                activation_code VARCHAR(6) UNIQUE,
+                zoom_date DATE,
+                registration_date TIMESTAMP,
+                language TEXT DEFAULT 'ru',
+                is_activated BOOLEAN DEFAULT FALSE,
+                activation_date TIMESTAMP
+            )
+        """)
+        cursor.execute("ALTER TABLE participants ADD COLUMN IF NOT EXISTS email TEXT")
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS participants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                telegram_id INTEGER UNIQUE NOT NULL,
+                username TEXT,
+                first_name TEXT,
+                email TEXT,
+                participant_type TEXT,
+                participant_id INTEGER UNIQUE,
+                activation_code TEXT UNIQUE,
+                zoom_date TEXT,
+                registration_date TEXT,
+                language TEXT DEFAULT 'ru',
+                is_activated INTEGER DEFAULT 0,
+                activation_date TEXT
+            )
+        """)
+        columns = [row['name'] for row in cursor.execute("PRAGMA table_info(participants)")]
+        if 'email' not in columns:
+            cursor.execute("ALTER TABLE participants ADD COLUMN email TEXT")
+
+
+def _create_participant_id_counter(db, cursor):
+    """Последовательность (PostgreSQL) или счётчик (SQLite) для ID участников"""
+    if db.use_postgres:
+        cursor.execute(f"""
+            CREATE SEQUENCE IF NOT EXISTS participant_id_seq
+            START WITH {FIRST_PARTICIPANT_ID} MINVALUE {FIRST_PARTICIPANT_ID}
+        """)
+        # Продолжаем уже выданные ID
+        cursor.execute("""
+            SELECT setval('participant_id_seq', MAX(participant_id))
+            FROM participants
+            HAVING MAX(participant_id) >= (SELECT last_value FROM participant_id_seq)
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS id_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO id_counters (name, value)
+            SELECT 'participant_id', COALESCE(MAX(participant_id), {FIRST_PARTICIPANT_ID - 1})
+            FROM participants
+        """)
+
+
+def _create_activation_code_pool(db, cursor):
+    """Пул свободных кодов активации в случайном порядке"""
+    # Коды уникальны по построению, отдельный индекс по code не нужен
+    code_type = 'VARCHAR(6)' if db.use_postgres else 'TEXT'
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS activation_code_pool (
+            position INTEGER PRIMARY KEY,
+            code {code_type} NOT NULL
+        )
+    """)
+    db._fill_activation_code_pool(cursor)
+
+
+def _create_date_capacity(db, cursor):
+    """Вместимость и число записанных по датам"""
+    date_type = 'DATE' if db.use_postgres else 'TEXT'
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS date_capacity (
+            zoom_date {date_type} PRIMARY KEY,
+            capacity INTEGER NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM date_capacity) AS filled")
+    if not cursor.fetchone()['filled']:
+        db._reconcile_date_capacity(cursor)
+
+
+def _create_participant_indexes(db, cursor):
+    """Индексы для выборок по дате, языку, email и сортировки по дате регистрации"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_participants_zoom_date ON participants (zoom_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_participants_language ON participants (language)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_participants_email_lower ON participants (lower(email))")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_participants_registration_date ON participants (registration_date)"
+    )
+
+
+def _create_registration_stats(db, cursor):
+    """Сводная статистика по группам участников (обновляется при каждой записи в participants)"""
+    # NULL в ключе хранится как '' (иначе группы без даты не попадают под первичный ключ)
+    activated_type = 'BOOLEAN' if db.use_postgres else 'INTEGER'
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS registration_stats (
+            zoom_date TEXT NOT NULL,
+            language TEXT NOT NULL,
+            participant_type TEXT NOT NULL,
+            is_activated {activated_type} NOT NULL,
+            participants INTEGER NOT NULL,
+            PRIMARY KEY (zoom_date, language, participant_type, is_activated)
+        )
+    """)
+    db._reconcile_registration_stats(cursor)
+
+
+def _create_media_cache(db, cursor):
+    """file_id Telegram для статичных файлов по хэшу содержимого"""
+    updated_at_type = 'TIMESTAMP' if db.use_postgres else 'TEXT'
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS media_cache (
+            content_hash TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            updated_at {updated_at_type},
+            PRIMARY KEY (content_hash, media_type)
+        )
+    """)
+
+
+def _create_activation_code_position(db, cursor):
+    """PostgreSQL: последовательность позиций пула кодов (выдача по ключу, без просмотра индекса)"""
+    if not db.use_postgres:
+        return
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS activation_code_position_seq")
+    # Уже выданные коды удалены из головы пула — позиции продолжаются с 1 без пропусков
+    db._compact_activation_code_pool(cursor)
+
+
+# (версия, описание, функция) — только добавлять в конец, уже выпущенные не менять
+MIGRATIONS = [
+    (1, "Таблица participants и поле email", _create_participants),
+    (2, "Счётчик ID участников", _create_participant_id_counter),
+    (3, "Пул кодов активации", _create_activation_code_pool),
+    (4, "Таблица date_capacity", _create_date_capacity),
+    (5, "Индексы таблицы participants", _create_participant_indexes),
+    (6, "Таблица registration_stats", _create_registration_stats),
+    (7, "Таблица media_cache", _create_media_cache),
+    (8, "Последовательность позиций пула кодов", _create_activation_code_position),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db, cursor) -> int:
+    """Текущая версия схемы (0 — миграции ещё не применялись)"""
+    if db.use_postgres:
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+    else:
+        cursor.execute(
+            "SELECT COUNT(*) > 0 AS present FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+        )
+    if not cursor.fetchone()['present']:
+        return 0
+    
+    cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return cursor.fetchone()['version']
+
+
+def _lock_sqlite(cursor):
+    """
+    BEGIN IMMEDIATE с повторами до MIGRATION_LOCK_TIMEOUT: каждая попытка сама ждёт
+    SQLITE_TIMEOUT, после неё — следующая, пока другой мигрирующий не закончит
+    """
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+    waiting = False
+    while True:
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() >= deadline:
+                raise
+            if not waiting:
+                logger.info("Database is locked by another migration, waiting...")
+                waiting = True
+
+
+def migrate(db):
+    """Применить недостающие миграции (в одной транзакции под блокировкой)"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        if get_schema_version(db, cursor) >= LATEST_VERSION:
+            return
+    
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        # Блокировка: параллельно стартующие процессы ждут, пока первый закончит
+        if db.use_postgres:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        else:
+            _lock_sqlite(cursor)
+        
+        applied_at_type = 'TIMESTAMP' if db.use_postgres else 'TEXT'
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at {applied_at_type}
+            )
+        """)
+        
+        current = get_schema_version(db, cursor)
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            
+            logger.info(f"Applying migration {version}: {description}")
+            apply(db, cursor)
+            
+            cursor.execute(
+                db._p("INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)"),
+                (version, description, db._ts(datetime.now()))
+            )
@@ -0,0 +1,111 @@
+"""
+Кэш строк участников в памяти процесса (LRU + TTL)
+Ключи: telegram_id и email. Записи в БД сбрасывают соответствующие строки.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class ParticipantCache:
+    """Потокобезопасный LRU-кэш участников с ограничением по размеру и времени жизни"""
+    
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._by_email: Dict[str, int] = {}
+        # Часы сбросов: строка, прочитанная до сброса этого же участника, в кэш уже не попадёт.
+        # Запись одного участника не мешает кэшировать чтения остальных.
+        self._clock = 0
+        # telegram_id -> время последнего сброса (не больше max_size отметок)
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+        # Строки, прочитанные раньше этого времени, не кладутся (clear и вытесненные отметки)
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def generation(self) -> int:
+        """Запомнить перед чтением из БД и передать в put()"""
+        return self._clock
+    
+    def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Строка участника по Telegram ID (копия) или None при промахе"""
+        with self._lock:
+            entry = self._rows.get(telegram_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(telegram_id)
+                self.misses += 1
+                return None
+            self._rows.move_to_end(telegram_id)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Строка участника по email без учёта регистра (копия) или None при промахе"""
+        with self._lock:
+            telegram_id = self._by_email.get(email.lower())
+        if telegram_id is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return self.get(telegram_id)
+    
+    def put(self, row: Dict[str, Any], generation: Optional[int] = None):
+        """Положить строку в кэш (пропускается, если с момента чтения был сброс)"""
+        with self._lock:
+            telegram_id = row['telegram_id']
+            if generation is not None and (
+                generation < self._floor or self._invalidated.get(telegram_id, 0) > generation
+            ):
+                return
+            self._drop(telegram_id)
+            self._rows[telegram_id] = (time.monotonic() + self.ttl, dict(row))
+            if row.get('email'):
+                self._by_email[row['email'].lower()] = telegram_id
+            while len(self._rows) > self.max_size:
+                self._drop(next(iter(self._rows)))
+    
+    def invalidate(self, *telegram_ids: int):
+        """Сбросить строки участников после записи в БД"""
+        with self._lock:
+            self._clock += 1
+            for telegram_id in telegram_ids:
+                self._drop(telegram_id)
+                self._invalidated[telegram_id] = self._clock
+                self._invalidated.move_to_end(telegram_id)
+            while len(self._invalidated) > self.max_size:
+                _, invalidated_at = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, invalidated_at)
+    
+    def clear(self):
+        """Сбросить весь кэш"""
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._invalidated.clear()
+            self._rows.clear()
+            self._by_email.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._rows),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+            }
+    
+    def _drop(self, telegram_id: int):
+        entry = self._rows.pop(telegram_id, None)
+        if entry is not None:
+            email = entry[1].get('email')
+            if email and self._by_email.get(email.lower()) == telegram_id:
+                del self._by_email[email.lower()]
@@ -0,0 +1,422 @@
+"""
+SQL-запросы бота в одном месте (PostgreSQL / SQLite)
+Каждый запрос записан один раз с плейсхолдерами %s, вариант для SQLite (?)
+готовится при загрузке модуля. Частые запросы помечены prepare=True:
+в PostgreSQL они сразу выполняются как подготовленные операторы.
+"""
+
+import functools
+from typing import Optional
+
+
+@functools.lru_cache(maxsize=512)
+def to_sqlite(sql: str) -> str:
+    """Плейсхолдеры %s -> ? (результат кэшируется и для динамических запросов)"""
+    return sql.replace('%s', '?')
+
+
+class Query:
+    """Запрос в двух диалектах: postgres — как записан, sqlite — с плейсхолдерами ?"""
+    
+    __slots__ = ('postgres', 'sqlite', 'prepare')
+    
+    def __init__(self, sql: str, sqlite: Optional[str] = None, prepare: bool = False):
+        self.postgres = sql
+        self.sqlite = to_sqlite(sqlite if sqlite is not None else sql)
+        self.prepare = prepare
+
+
+# --- Участники ---
+
+SELECT_USER = Query(
+    "SELECT * FROM participants WHERE telegram_id = %s",
+    prepare=True
+)
+
+SELECT_USER_BY_EMAIL = Query(
+    "SELECT * FROM participants WHERE lower(email) = lower(%s)",
+    prepare=True
+)
+
+UPDATE_EMAIL = Query("UPDATE participants SET email = %s WHERE telegram_id = %s")
+
+UPDATE_LANGUAGE = Query(
+    "UPDATE participants SET language = %s WHERE telegram_id = %s",
+    prepare=True
+)
+
+ACTIVATE_BY_CODE = Query("""
+    UPDATE participants SET is_activated = TRUE, activation_date = %s
+    WHERE activation_code = %s
+    RETURNING telegram_id
+""")
+
+# Массовая активация: активированные сейчас (с группой статистики до активации)
+ACTIVATE_BY_CODES = Query(
+    """
+    UPDATE participants SET is_activated = TRUE, activation_date = %s
+    WHERE activation_code = ANY(%s::text[]) AND NOT COALESCE(is_activated, FALSE)
+    RETURNING activation_code, telegram_id, zoom_date, language, participant_type
+    """,
+    sqlite="""
+    UPDATE participants SET is_activated = TRUE, activation_date = %s
+    WHERE activation_code IN (SELECT value FROM json_each(%s)) AND NOT COALESCE(is_activated, FALSE)
+    RETURNING activation_code, telegram_id, zoom_date, language, participant_type
+    """
+)
+
+# Какие из кодов выданы участникам
+SELECT_KNOWN_ACTIVATION_CODES = Query(
+    "SELECT activation_code FROM participants WHERE activation_code = ANY(%s::text[])",
+    sqlite="SELECT activation_code FROM participants WHERE activation_code IN (SELECT value FROM json_each(%s))"
+)
+
+# Группа статистики участника до изменения (строка блокируется до конца транзакции)
+SELECT_PARTICIPANT_GROUP = Query(
+    "SELECT zoom_date, language, participant_type, is_activated FROM participants WHERE telegram_id = %s FOR UPDATE",
+    sqlite="SELECT zoom_date, language, participant_type, is_activated FROM participants WHERE telegram_id = %s"
+)
+
+SELECT_PARTICIPANT_GROUP_BY_CODE = Query(
+    """
+    SELECT zoom_date, language, participant_type, is_activated FROM participants
+    WHERE activation_code = %s FOR UPDATE
+    """,
+    sqlite="""
+    SELECT zoom_date, language, participant_type, is_activated FROM participants
+    WHERE activation_code = %s
+    """
+)
+
+# --- ID и коды активации ---
+
+RESERVE_PARTICIPANT_IDS = Query(
+    "SELECT nextval('participant_id_seq') AS id FROM generate_series(1, %s)"
+)
+
+ADVANCE_ID_COUNTER = Query(
+    "UPDATE id_counters SET value = value + %s WHERE name = 'participant_id' RETURNING value"
+)
+
+ACTIVATION_CODE_POOL_FILLED = Query("SELECT EXISTS (SELECT 1 FROM activation_code_pool) AS filled")
+
+# PostgreSQL: все ещё не выданные коды диапазона в случайном порядке — одним запросом
+FILL_ACTIVATION_CODE_POOL = Query("""
+    INSERT INTO activation_code_pool (position, code)
+    SELECT row_number() OVER (ORDER BY random()), c::text
+    FROM generate_series(%s::integer, %s::integer) AS c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM participants p WHERE p.activation_code = c::text
+    )
+    ON CONFLICT DO NOTHING
+""")
+
+# SQLite: коды перемешиваются в Python и вставляются через executemany
+SELECT_USED_ACTIVATION_CODES = Query(
+    "SELECT activation_code FROM participants WHERE activation_code IS NOT NULL"
+)
+
+INSERT_ACTIVATION_CODE = Query(
+    "INSERT INTO activation_code_pool (position, code) VALUES (%s, %s) ON CONFLICT DO NOTHING"
+)
+
+# Следующий код из пула (атомарно, в текущей транзакции).
+# PostgreSQL: позицию выдаёт последовательность, строка удаляется по точному ключу —
+# без просмотра головы индекса, где до VACUUM копятся удалённые записи. Позиция
+# из откатившейся транзакции не возвращается (код просто не будет выдан).
+TAKE_ACTIVATION_CODE = Query(
+    """
+    DELETE FROM activation_code_pool
+    WHERE position = (SELECT nextval('activation_code_position_seq'))
+    RETURNING code
+    """,
+    sqlite="""
+    DELETE FROM activation_code_pool
+    WHERE position = (SELECT MIN(position) FROM activation_code_pool)
+    RETURNING code
+    """,
+    prepare=True
+)
+
+# Пачка кодов из пула для массового импорта
+TAKE_ACTIVATION_CODES = Query(
+    """
+    DELETE FROM activation_code_pool
+    WHERE position = ANY(ARRAY(
+        SELECT nextval('activation_code_position_seq') FROM generate_series(1, %s)
+    ))
+    RETURNING code
+    """,
+    sqlite="""
+    DELETE FROM activation_code_pool
+    WHERE position IN (SELECT position FROM activation_code_pool ORDER BY position LIMIT %s)
+    RETURNING code
+    """
+)
+
+# PostgreSQL: позиции пула без пропусков, начиная с 1 (последовательность выдаёт их подряд)
+ACTIVATION_CODE_POOL_BOUNDS = Query("""
+    SELECT MIN(position) AS first, MAX(position) AS last, COUNT(*) AS total
+    FROM activation_code_pool
+""")
+
+# Перенумерация в два шага: через отрицательные позиции, чтобы не нарушить первичный ключ
+RENUMBER_ACTIVATION_CODE_POOL = Query("""
+    UPDATE activation_code_pool pool SET position = -numbered.rank
+    FROM (
+        SELECT position, row_number() OVER (ORDER BY position) AS rank
+        FROM activation_code_pool
+    ) numbered
+    WHERE pool.position = numbered.position
+""")
+
+RESTORE_ACTIVATION_CODE_POSITIONS = Query("UPDATE activation_code_pool SET position = -position")
+
+RESET_ACTIVATION_CODE_POSITION = Query(
+    "SELECT setval('activation_code_position_seq', %s, false)"
+)
+
+# --- Регистрация ---
+
+_INSERT_PARTICIPANT = """
+    INSERT INTO participants
+    (telegram_id, username, first_name, email, participant_type,
+     participant_id, activation_code, zoom_date, registration_date, language)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+INSERT_PARTICIPANT = Query(_INSERT_PARTICIPANT + "RETURNING *")
+
+# Для executemany при импорте (без RETURNING)
+IMPORT_PARTICIPANT = Query(_INSERT_PARTICIPANT)
+
+# Кто из списка уже зарегистрирован: массив в PostgreSQL, JSON-массив в SQLite
+SELECT_EXISTING_TELEGRAM_IDS = Query(
+    "SELECT telegram_id FROM participants WHERE telegram_id = ANY(%s::bigint[])",
+    sqlite="SELECT telegram_id FROM participants WHERE telegram_id IN (SELECT value FROM json_each(%s))"
+)
+
+# Какие email из списка (в нижнем регистре) уже зарегистрированы — по idx_participants_email_lower
+SELECT_EXISTING_EMAILS = Query(
+    "SELECT lower(email) AS email FROM participants WHERE lower(email) = ANY(%s::text[])",
+    sqlite="SELECT lower(email) AS email FROM participants WHERE lower(email) IN (SELECT value FROM json_each(%s))"
+)
+
+# PostgreSQL: промежуточная таблица для COPY (очищается при commit)
+CREATE_IMPORT_STAGING = Query("""
+    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+        telegram_id BIGINT,
+        username TEXT,
+        first_name TEXT,
+        email TEXT,
+        participant_type TEXT,
+        participant_id INTEGER,
+        activation_code VARCHAR(6),
+        zoom_date DATE,
+        registration_date TIMESTAMP,
+        language TEXT
+    ) ON COMMIT DELETE ROWS
+""")
+
+COPY_IMPORT_STAGING = Query("""
+    COPY import_staging
+    (telegram_id, username, first_name, email, participant_type,
+     participant_id, activation_code, zoom_date, registration_date, language)
+    FROM STDIN
+""")
+
+INSERT_FROM_IMPORT_STAGING = Query("""
+    INSERT INTO participants
+    (telegram_id, username, first_name, email, participant_type,
+     participant_id, activation_code, zoom_date, registration_date, language)
+    SELECT telegram_id, username, first_name, email, participant_type,
+           participant_id, activation_code, zoom_date, registration_date, language
+    FROM import_staging
+    ON CONFLICT DO NOTHING
+    RETURNING telegram_id, zoom_date, language, participant_type
+""")
+
+# PostgreSQL: место на дату, код и строка участника — одним запросом
+_REGISTER_INSERT = """
+    INSERT INTO participants
+    (telegram_id, username, first_name, email, participant_type,
+     participant_id, activation_code, zoom_date, registration_date, language)
+    SELECT %s, %s, %s, %s, %s, COALESCE(%s, nextval('participant_id_seq')),
+           code.code, {date_value}, %s, %s
+    FROM {sources}
+    RETURNING *
+"""
+
+REGISTER_WITHOUT_DATE = Query(
+    f"WITH code AS ({TAKE_ACTIVATION_CODE.postgres})"
+    + _REGISTER_INSERT.format(date_value="NULL::date", sources="code"),
+    prepare=True
+)
+
+# Позиция пула берётся только вместе с местом: nextval выполняется по строке seat,
+# поэтому отказ из-за заполненной даты не сдвигает последовательность
+REGISTER_WITH_DATE = Query(
+    """WITH seat AS (
+        INSERT INTO date_capacity (zoom_date, capacity, booked) VALUES (%s, %s, 1)
+        ON CONFLICT (zoom_date) DO UPDATE SET booked = date_capacity.booked + 1
+        WHERE date_capacity.booked < date_capacity.capacity
+        RETURNING zoom_date
+    ), code AS (
+        DELETE FROM activation_code_pool
+        WHERE position = (SELECT nextval('activation_code_position_seq') FROM seat)
+        RETURNING code
+    )"""
+    + _REGISTER_INSERT.format(date_value="seat.zoom_date", sources="code, seat"),
+    prepare=True
+)
+
+# --- Места на датах ---
+
+_BOOK_SEAT = """
+    INSERT INTO date_capacity (zoom_date, capacity, booked) VALUES (%s, %s, 1)
+    ON CONFLICT (zoom_date) DO UPDATE SET booked = date_capacity.booked + 1
+"""
+
+# Место без проверки вместимости (перенос администратором)
+BOOK_SEAT = Query(_BOOK_SEAT + " RETURNING booked")
+
+# Условное увеличение: строка блокируется, проверка и инкремент — одна операция
+BOOK_SEAT_IF_FREE = Query(
+    _BOOK_SEAT + " WHERE date_capacity.booked < date_capacity.capacity RETURNING booked",
+    prepare=True
+)
+
+# Добавить сразу несколько записанных на дату (импорт, без проверки вместимости)
+ADD_BOOKED = Query("""
+    INSERT INTO date_capacity (zoom_date, capacity, booked) VALUES (%s, %s, %s)
+    ON CONFLICT (zoom_date) DO UPDATE SET booked = date_capacity.booked + excluded.booked
+""")
+
+RELEASE_SEAT = Query("UPDATE date_capacity SET booked = booked - 1 WHERE zoom_date = %s")
+
+# PostgreSQL, перенос между датами: строки обеих дат блокируются заранее в порядке даты —
+# встречные переносы A→B и B→A иначе берут те же две строки в разном порядке (deadlock).
+# Строки новой даты может ещё не быть, но тогда с неё никто и не переносится
+LOCK_DATE_SEATS = Query(
+    "SELECT zoom_date FROM date_capacity WHERE zoom_date = ANY(%s::date[]) ORDER BY zoom_date FOR UPDATE",
+    prepare=True
+)
+
+UPDATE_ZOOM_DATE = Query("UPDATE participants SET zoom_date = %s WHERE telegram_id = %s")
+
+# Один оператор для любого числа дат: массив в PostgreSQL, JSON-массив в SQLite
+SELECT_DATES_CAPACITY = Query(
+    "SELECT zoom_date, capacity, booked FROM date_capacity WHERE zoom_date = ANY(%s::date[])",
+    sqlite="SELECT zoom_date, capacity, booked FROM date_capacity WHERE zoom_date IN (SELECT value FROM json_each(%s))",
+    prepare=True
+)
+
+SET_DATE_CAPACITY = Query("""
+    INSERT INTO date_capacity (zoom_date, capacity, booked) VALUES (%s, %s, 0)
+    ON CONFLICT (zoom_date) DO UPDATE SET capacity = excluded.capacity
+""")
+
+# PostgreSQL: то же для пересчёта booked (см. LOCK_REGISTRATION_STATS), но EXCLUSIVE:
+# перенос сначала берёт строки через FOR UPDATE (ROW SHARE) и только потом пишет —
+# SHARE ROW EXCLUSIVE пропустил бы его между этими шагами (deadlock с пересчётом)
+LOCK_DATE_CAPACITY = Query("LOCK TABLE date_capacity IN EXCLUSIVE MODE")
+
+RESET_BOOKED = Query("UPDATE date_capacity SET booked = 0")
+
+RECOUNT_BOOKED = Query("""
+    INSERT INTO date_capacity (zoom_date, capacity, booked)
+    SELECT zoom_date, %s, COUNT(*) FROM participants
+    WHERE zoom_date IS NOT NULL
+    GROUP BY zoom_date
+    ON CONFLICT (zoom_date) DO UPDATE SET booked = excluded.booked
+""")
+
+# --- Сводная статистика registration_stats ---
+# Ключ группы — (zoom_date, language, participant_type, is_activated), NULL хранится как ''
+
+ADD_REGISTRATION_STATS = Query(
+    """
+    INSERT INTO registration_stats (zoom_date, language, participant_type, is_activated, participants)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (zoom_date, language, participant_type, is_activated)
+    DO UPDATE SET participants = registration_stats.participants + excluded.participants
+    """,
+    prepare=True
+)
+
+# Всего и активировано по (zoom_date, language, participant_type) — O(число групп)
+SELECT_REGISTRATION_STATS = Query("""
+    SELECT NULLIF(zoom_date, '') AS zoom_date,
+           NULLIF(language, '') AS language,
+           NULLIF(participant_type, '') AS participant_type,
+           SUM(participants) AS total,
+           SUM(CASE WHEN is_activated THEN participants ELSE 0 END) AS activated
+    FROM registration_stats
+    GROUP BY zoom_date, language, participant_type
+    HAVING SUM(participants) > 0
+""")
+
+# PostgreSQL: на время пересчёта — без встречных изменений счётчиков. Конфликтует с
+# ROW EXCLUSIVE (INSERT / UPDATE): ждёт начатые транзакции и задерживает новые до commit
+LOCK_REGISTRATION_STATS = Query("LOCK TABLE registration_stats IN SHARE ROW EXCLUSIVE MODE")
+
+RESET_REGISTRATION_STATS = Query("DELETE FROM registration_stats")
+
+RECOUNT_REGISTRATION_STATS = Query("""
+    INSERT INTO registration_stats (zoom_date, language, participant_type, is_activated, participants)
+    SELECT COALESCE(CAST(zoom_date AS TEXT), ''), COALESCE(language, ''),
+           COALESCE(participant_type, ''), COALESCE(is_activated, FALSE), COUNT(*)
+    FROM participants
+    GROUP BY 1, 2, 3, 4
+""")
+
+# --- Кэш file_id Telegram (media.py) ---
+
+SELECT_MEDIA_FILE_ID = Query(
+    "SELECT file_id FROM media_cache WHERE content_hash = %s AND media_type = %s",
+    prepare=True
+)
+
+SAVE_MEDIA_FILE_ID = Query("""
+    INSERT INTO media_cache (content_hash, media_type, file_id, updated_at) VALUES (%s, %s, %s, %s)
+    ON CONFLICT (content_hash, media_type) DO UPDATE SET file_id = excluded.file_id, updated_at = excluded.updated_at
+""")
+
+# Удалить только устаревший file_id (другой процесс мог уже записать новый)
+DELETE_MEDIA_FILE_ID = Query(
+    "DELETE FROM media_cache WHERE content_hash = %s AND media_type = %s AND file_id = %s"
+)
+
+# --- Перенос SQLite -> PostgreSQL ---
+
+# Все участники в порядке id (контрольная сумма; колонки — как PARTICIPANT_COLUMNS)
+SELECT_PARTICIPANTS_BY_ID = Query("""
+    SELECT id, telegram_id, username, first_name, email, participant_type,
+           participant_id, activation_code, zoom_date, registration_date,
+           language, is_activated, activation_date
+    FROM participants ORDER BY id
+""")
+
+COPY_PARTICIPANTS = Query("""
+    COPY participants
+    (id, telegram_id, username, first_name, email, participant_type,
+     participant_id, activation_code, zoom_date, registration_date,
+     language, is_activated, activation_date)
+    FROM STDIN
+""")
+
+# Последовательности — за максимальные перенесённые ID
+SYNC_ROW_ID_SEQUENCE = Query(
+    "SELECT setval(pg_get_serial_sequence('participants', 'id'), MAX(id)) FROM participants"
+)
+
+SYNC_PARTICIPANT_ID_SEQUENCE = Query(
+    "SELECT setval('participant_id_seq', GREATEST(MAX(participant_id), %s)) FROM participants"
+)
+
+# Убрать из пула коды, уже выданные перенесённым участникам
+DROP_USED_ACTIVATION_CODES = Query("""
+    DELETE FROM activation_code_pool pool
+    USING participants p
+    WHERE pool.code = p.activation_code
+""")
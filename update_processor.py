@@ -0,0 +1,74 @@
+"""
+Параллельная обработка обновлений Telegram с сохранением порядка внутри чата
+Обновления разных чатов обрабатываются одновременно (не больше concurrency_limit),
+обновления одного чата — строго по очереди, поэтому состояния ConversationHandler
+не перемешиваются.
+"""
+
+import asyncio
+from typing import Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Лимит для BaseUpdateProcessor.process_update (он помечен @final): фактический
+# лимит параллелизма берётся в do_process_update, после очереди чата
+_UNBOUNDED = 2 ** 31 - 1
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Ограниченный параллелизм между чатами, строгий порядок внутри чата"""
+    
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(_UNBOUNDED)
+        self.concurrency_limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> [блокировка, число обновлений чата в работе и в очереди]
+        self._chats: Dict[int, list] = {}
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        # Сначала очередь чата, потом общий лимит: обновления, ждущие свой чат,
+        # не занимают слоты параллелизма
+        key = self._chat_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+    
+    @property
+    def active_chats(self) -> int:
+        """Чатов с обновлениями в работе или в очереди"""
+        return len(self._chats)
+    
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        """Чат обновления (для inline-запросов без чата — пользователь)"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
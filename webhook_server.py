@@ -0,0 +1,189 @@
+"""
+Приём обновлений Telegram через webhook (альтернатива run_polling)
+Один ASGI-сервер (uvicorn) обслуживает:
+    POST {WEBHOOK_PATH} — обновления от Telegram (проверка секретного токена)
+    GET  /healthz       — проверка живости для балансировщика / Render
+    GET  /metrics       — метрики в формате Prometheus
+Поддерживается только ОДИН экземпляр бота: состояние диалогов (ConversationHandler,
+user_data), кэш участников и кэш мест в выборе даты живут в памяти процесса,
+а run_both_bots.py запускает email-бота (IMAP) в каждом экземпляре.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Ограничение размера тела запроса (обновления Telegram значительно меньше)
+MAX_BODY_SIZE = 1024 * 1024
+
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+
+
+class WebhookApp:
+    """ASGI-приложение: кладёт обновления в очередь Application, отдаёт /healthz и /metrics"""
+    
+    def __init__(
+        self,
+        application: Application,
+        secret_token: str,
+        path: str = '/telegram',
+        metrics: Optional[Callable[[], str]] = None
+    ):
+        self.application = application
+        self.secret_token = secret_token.encode()
+        self.path = path
+        self.metrics = metrics
+        self.received = 0
+        self.rejected = 0
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        
+        path, method = scope['path'], scope['method']
+        if path == self.path:
+            if method != 'POST':
+                await self._respond(send, 405, b'method not allowed')
+            else:
+                await self._handle_update(scope, receive, send)
+        elif path == '/healthz' and method in ('GET', 'HEAD'):
+            await self._respond(send, 200, b'ok')
+        elif path == '/metrics' and method == 'GET':
+            await self._respond(send, 200, self.prometheus_text().encode(), b'text/plain; version=0.0.4')
+        else:
+            await self._respond(send, 404, b'not found')
+    
+    async def _handle_update(self, scope, receive, send):
+        token = dict(scope['headers']).get(SECRET_HEADER, b'')
+        if not hmac.compare_digest(token, self.secret_token):
+            self._count(rejected=True)
+            await self._respond(send, 403, b'forbidden')
+            return
+        
+        body = await self._read_body(receive)
+        if body is None:
+            self._count(rejected=True)
+            await self._respond(send, 413, b'payload too large')
+            return
+        
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Malformed webhook update: {e}")
+            self._count(rejected=True)
+            await self._respond(send, 400, b'bad request')
+            return
+        
+        # Обработка идёт в Application; Telegram получает ответ сразу
+        await self.application.update_queue.put(update)
+        self._count()
+        await self._respond(send, 200, b'ok')
+    
+    def prometheus_text(self) -> str:
+        """Счётчики webhook и (если переданы) метрики БД"""
+        lines = [
+            "# HELP summit_webhook_updates_total Updates accepted from Telegram",
+            "# TYPE summit_webhook_updates_total counter",
+            f"summit_webhook_updates_total {self.received}",
+            "# HELP summit_webhook_rejected_total Webhook requests rejected (secret, size, format)",
+            "# TYPE summit_webhook_rejected_total counter",
+            f"summit_webhook_rejected_total {self.rejected}",
+            "# HELP summit_update_queue_size Updates waiting for processing",
+            "# TYPE summit_update_queue_size gauge",
+            f"summit_update_queue_size {self.application.update_queue.qsize()}",
+        ]
+        text = "\n".join(lines) + "\n"
+        if self.metrics is not None:
+            text += self.metrics()
+        return text
+    
+    def _count(self, rejected: bool = False):
+        # Вызывается только из event loop сервера — блокировка не нужна
+        if rejected:
+            self.rejected += 1
+        else:
+            self.received += 1
+    
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        """Тело запроса целиком (None — больше MAX_BODY_SIZE)"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+    
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, content_type: bytes = b'text/plain'):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+    
+    @staticmethod
+    async def _lifespan(receive, send):
+        # Application запускается и останавливается в serve_webhook, здесь только подтверждение
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+async def serve_webhook(
+    application: Application,
+    webhook_url: str,
+    secret_token: str,
+    port: int,
+    path: str = '/telegram',
+    metrics: Optional[Callable[[], str]] = None
+):
+    """Зарегистрировать webhook в Telegram и обслуживать обновления до остановки сервера (SIGTERM / Ctrl+C)"""
+    import uvicorn
+    
+    app = WebhookApp(application, secret_token, path, metrics)
+    server = uvicorn.Server(uvicorn.Config(
+        app, host='0.0.0.0', port=port, log_level='warning', access_log=False
+    ))
+    
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=webhook_url.rstrip('/') + path,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES
+        )
+        await application.start()
+        logger.info(f"Webhook server listening on port {port}, path {path}")
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+def run_webhook(application: Application, **kwargs):
+    """Синхронная точка входа (как application.run_polling)"""
+    asyncio.run(serve_webhook(application, **kwargs))